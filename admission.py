@@ -0,0 +1,280 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Dict, Iterable, List, Optional
+
+from pydantic import Field
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+
+from history_reducer import estimate_tokens
+
+# Call priorities, lower first: a student waiting on a chat turn goes ahead of batch grading
+INTERACTIVE = 0
+BATCH = 1
+
+# Priority of model calls made by the current task
+call_priority: ContextVar[int] = ContextVar("call_priority", default=INTERACTIVE)
+
+# Default concurrent calls per service; o1 is slow and has the tightest quota
+DEFAULT_CONCURRENCY = {"gpt4o": 32, "o1-model": 8, "o3-mini": 16}
+
+# Completion tokens reserved against the TPM limit when a call does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+# Process-wide admission counters, per service
+admission_stats: Dict[str, Counter] = defaultdict(Counter)
+
+
+class ServiceBusy(Exception):
+    """Raised instead of waiting when a service's admission queue is full."""
+
+    def __init__(self, service_id: str, retry_after: float):
+        super().__init__(f"The tutor is busy right now ({service_id}); please retry in {retry_after:.0f} seconds")
+        self.service_id = service_id
+        self.retry_after = retry_after
+
+
+def find_busy(error: BaseException) -> Optional[ServiceBusy]:
+    """Return the ServiceBusy behind `error`, which agents and strategies may have wrapped."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, ServiceBusy):
+            return error
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+
+class TokenBucket:
+    """Allows `per_minute` units per minute, in bursts of up to a minute's worth."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` units are available (requests larger than a minute's worth wait for a full bucket)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class DeploymentLimiter:
+    """
+    Admission control for one model deployment.
+
+    At most `max_concurrency` calls run at once; further calls wait in a
+    priority queue (interactive before batch, then first come first served).
+    Admitted calls also wait for the RPM and TPM token buckets. When the queue
+    already holds `max_queue` interactive calls, new interactive calls fail
+    fast with ServiceBusy instead of waiting without bound. Batch calls always
+    wait their turn: they are bounded by the batch's own concurrency, and
+    never go ahead of interactive calls.
+    """
+
+    def __init__(
+        self,
+        service_id: str,
+        max_concurrency: Optional[int] = None,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        max_queue: Optional[int] = None,
+    ):
+        """
+        Initialize the DeploymentLimiter.
+
+        Args:
+            service_id: The kernel service the limits apply to
+            max_concurrency: Calls running at once
+                (defaults to TUTOR_LIMIT_<SERVICE>_CONCURRENCY, 32 for gpt4o, 8 for o1-model, 16 otherwise)
+            rpm: Requests per minute, 0 for no limit (defaults to TUTOR_LIMIT_<SERVICE>_RPM or 0)
+            tpm: Prompt plus completion tokens per minute, 0 for no limit
+                (defaults to TUTOR_LIMIT_<SERVICE>_TPM or 0)
+            max_queue: Interactive calls allowed to wait for a slot
+                (defaults to TUTOR_LIMIT_<SERVICE>_QUEUE or four times max_concurrency)
+
+        <SERVICE> is the service id in upper case with dashes as underscores, e.g. O1_MODEL.
+        """
+        prefix = f"TUTOR_LIMIT_{service_id.upper().replace('-', '_')}"
+        self.service_id = service_id
+        self.max_concurrency = max(1, max_concurrency if max_concurrency is not None else int(
+            os.getenv(f"{prefix}_CONCURRENCY", str(DEFAULT_CONCURRENCY.get(service_id, 16)))
+        ))
+        rpm = rpm if rpm is not None else int(os.getenv(f"{prefix}_RPM", "0"))
+        tpm = tpm if tpm is not None else int(os.getenv(f"{prefix}_TPM", "0"))
+        self.rpm = TokenBucket(rpm) if rpm > 0 else None
+        self.tpm = TokenBucket(tpm) if tpm > 0 else None
+        self.max_queue = max_queue if max_queue is not None else int(
+            os.getenv(f"{prefix}_QUEUE", str(4 * self.max_concurrency))
+        )
+        self._active = 0
+        self._waiters: List[list] = []
+        self._sequence = itertools.count()
+        # Moving average of call duration, for the Retry-After estimate
+        self._average_call_seconds = 5.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def queued_interactive(self) -> int:
+        return sum(1 for priority, _, _ in self._waiters if priority == INTERACTIVE)
+
+    def retry_after(self) -> float:
+        """Rough seconds until a newly queued interactive call would be admitted."""
+        return max(1.0, (self.queued_interactive + 1) / self.max_concurrency * self._average_call_seconds)
+
+    def check(self):
+        """Raise ServiceBusy if a new interactive call would be turned away."""
+        if self._active >= self.max_concurrency and self.queued_interactive >= self.max_queue:
+            admission_stats[self.service_id]["rejected"] += 1
+            raise ServiceBusy(self.service_id, self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0) -> AsyncGenerator[None, None]:
+        """Hold one of the deployment's call slots, after the rate limits allow `tokens` more tokens."""
+        stats = admission_stats[self.service_id]
+        start = time.monotonic()
+        await self._acquire()
+        try:
+            await self._wait_for_rate(tokens)
+            stats["wait_ms"] += int((time.monotonic() - start) * 1000)
+            stats["admitted"] += 1
+            call_start = time.monotonic()
+            yield
+            self._average_call_seconds = 0.9 * self._average_call_seconds + 0.1 * (time.monotonic() - call_start)
+        finally:
+            self._release()
+
+    async def _acquire(self):
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            return
+
+        priority = call_priority.get()
+        if priority == INTERACTIVE:
+            self.check()
+        stats = admission_stats[self.service_id]
+        stats["waited"] += 1
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._sequence), future]
+        heapq.heappush(self._waiters, entry)
+        stats["max_queue_seen"] = max(stats["max_queue_seen"], self.queued)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the caller gave up: pass it on
+                self._release()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def _release(self):
+        # Hand the slot straight to the most urgent waiter, if any
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    async def _wait_for_rate(self, tokens: int):
+        while True:
+            delay = max(
+                self.rpm.delay(1) if self.rpm else 0.0,
+                self.tpm.delay(tokens) if self.tpm else 0.0,
+            )
+            if delay <= 0:
+                break
+            admission_stats[self.service_id]["rate_limited"] += 1
+            await asyncio.sleep(delay)
+        if self.rpm:
+            self.rpm.take(1)
+        if self.tpm:
+            self.tpm.take(tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **admission_stats[self.service_id],
+            "active": self._active,
+            "queued": self.queued,
+            "queued_interactive": self.queued_interactive,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rpm": int(self.rpm.capacity) if self.rpm else 0,
+            "tpm": int(self.tpm.capacity) if self.tpm else 0,
+        }
+
+
+# One limiter per service id, shared by every kernel in the process
+limiters: Dict[str, DeploymentLimiter] = {}
+
+
+def get_limiter(service_id: str) -> DeploymentLimiter:
+    """Return the process-wide limiter for a service, creating it from the environment on first use."""
+    limiter = limiters.get(service_id)
+    if limiter is None:
+        limiter = limiters[service_id] = DeploymentLimiter(service_id)
+    return limiter
+
+
+def check_admission(service_ids: Iterable[str]):
+    """Raise ServiceBusy if any of the services would turn a new call away."""
+    for service_id in service_ids:
+        get_limiter(service_id).check()
+
+
+def estimate_call_tokens(chat_history: Any, settings: Any) -> int:
+    """Tokens a call counts against TPM: the prompt's estimate plus the completion allowance."""
+    prompt_tokens = sum(estimate_tokens(message.content) for message in chat_history.messages)
+    completion_tokens = (
+        getattr(settings, "max_completion_tokens", None)
+        or getattr(settings, "max_tokens", None)
+        or DEFAULT_COMPLETION_TOKENS
+    )
+    return prompt_tokens + completion_tokens
+
+
+class LimitedAzureChatCompletion(AzureChatCompletion):
+    """An AzureChatCompletion whose calls go through the deployment's admission control."""
+
+    limiter: Optional[DeploymentLimiter] = Field(default=None, exclude=True)
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.limiter = get_limiter(self.service_id)
+
+    async def _inner_get_chat_message_contents(self, chat_history, settings):
+        async with self.limiter.slot(estimate_call_tokens(chat_history, settings)):
+            return await super()._inner_get_chat_message_contents(chat_history, settings)
+
+    async def _inner_get_streaming_chat_message_contents(self, chat_history, settings, function_invoke_attempt: int = 0):
+        async with self.limiter.slot(estimate_call_tokens(chat_history, settings)):
+            async for messages in super()._inner_get_streaming_chat_message_contents(
+                chat_history, settings, function_invoke_attempt
+            ):
+                yield messages
+
+
+def get_admission_stats() -> Dict[str, Any]:
+    """Return active, queued, rejected and rate-limited calls per service."""
+    return {service_id: limiter.stats() for service_id, limiter in sorted(limiters.items())}
@@ -2,14 +2,15 @@ import os
 import asyncio
 from dotenv import load_dotenv
 
-from semantic_kernel import Kernel
-from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
-from semantic_kernel.contents import ChatHistory
+from semantic_kernel.contents import AuthorRole, ChatHistory
+from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
 from semantic_kernel.functions import KernelArguments
 from semantic_kernel.connectors.ai.function_choice_behavior import FunctionChoiceBehavior
 from semantic_kernel.prompt_template import PromptTemplateConfig, InputVariable
 from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings
 
+from service_factory import create_kernel
+
 
 def validate_environment():
     """Validate that all required environment variables are present."""
@@ -36,34 +37,14 @@ def validate_environment():
 
 def setup_kernel_with_models():
     """Create and configure a kernel with both primary and secondary models."""
-    kernel = Kernel()
+    # Shared with the API: pooled keep-alive connections per endpoint
+    kernel = create_kernel()
 
-    # Register the primary GPT-4o model for conversation
     primary_model_id = os.getenv("AZURE_OPENAI_DEPLOYMENT_4o")
     primary_service_id = "gpt4o"
-
-    kernel.add_service(
-        AzureChatCompletion(
-            service_id=primary_service_id,
-            deployment_name=primary_model_id,
-            api_key=os.getenv("AZURE_OPENAI_API_KEY_4o"),
-            endpoint=os.getenv("AZURE_OPENAI_ENDPOINT_4o")
-        )
-    )
-
-    # Register the secondary o1 model for deep reasoning
     secondary_model_id = os.getenv("AZURE_OPENAI_DEPLOYMENT_o1")
     secondary_service_id = "o1-model"
 
-    kernel.add_service(
-        AzureChatCompletion(
-            service_id=secondary_service_id,
-            deployment_name=secondary_model_id,
-            api_key=os.getenv("AZURE_OPENAI_API_KEY_o1"),
-            endpoint=os.getenv("AZURE_OPENAI_ENDPOINT_o1")
-        )
-    )
-    
     return kernel, primary_service_id, primary_model_id, secondary_service_id, secondary_model_id
 
 
@@ -108,32 +89,32 @@ def create_reasoning_function(kernel, secondary_service_id, secondary_model_id):
     )
 
 
-def create_chat_function(kernel, primary_service_id, primary_model_id):
-    """Create and register the chat function."""
-    chat_prompt = """{{$chat_history}}\nUser: {{$user_input}}\nTutor:"""
+def trim_history(chat_history, max_turns=None, keep_turns=None):
+    """
+    Drop the oldest turns once the history holds more than `max_turns` user turns.
+
+    Trimming happens in blocks (down to `keep_turns`) rather than one turn at a
+    time, so between trims the prompt only grows at the end and its prefix
+    stays identical from turn to turn for provider-side prompt caching.
+    System messages are always kept, and turns are cut at user messages so a
+    function call is never separated from its result.
+
+    Args:
+        chat_history: The ChatHistory to trim in place
+        max_turns: Turns kept before trimming (defaults to TUTOR_CONSOLE_HISTORY_TURNS or 8)
+        keep_turns: Turns left after trimming (defaults to half of max_turns)
+    """
+    max_turns = max_turns if max_turns is not None else int(os.getenv("TUTOR_CONSOLE_HISTORY_TURNS", "8"))
+    keep_turns = keep_turns if keep_turns is not None else max(1, max_turns // 2)
 
-    chat_config = PromptTemplateConfig(
-        template=chat_prompt,
-        name="chat",
-        template_format="semantic-kernel",
-        input_variables=[
-            InputVariable(name="chat_history", description="The conversation history", is_required=True),
-            InputVariable(name="user_input", description="The user's input", is_required=True),
-        ],
-        execution_settings={
-            primary_service_id: {
-                "model": primary_model_id,
-                "temperature": 0.7,
-                "max_tokens": 1000
-            }
-        }
-    )
+    turn_starts = [i for i, message in enumerate(chat_history.messages) if message.role == AuthorRole.USER]
+    if len(turn_starts) <= max_turns:
+        return
 
-    return kernel.add_function(
-        function_name="Chat",
-        plugin_name="TutorPlugin",
-        prompt_template_config=chat_config,
-    )
+    cut = turn_starts[-keep_turns]
+    chat_history.messages = [
+        message for message in chat_history.messages[:cut] if message.role == AuthorRole.SYSTEM
+    ] + chat_history.messages[cut:]
 
 
 def get_system_message():
@@ -157,7 +138,7 @@ def get_system_message():
     """
 
 
-def setup_chat_interface(kernel, chat_function, primary_service_id, primary_model_id):
+def setup_chat_interface(kernel, primary_service_id, primary_model_id):
     """Set up the chat interface with history and settings."""
     # Initialize chat history
     chat_history = ChatHistory()
@@ -174,27 +155,30 @@ def setup_chat_interface(kernel, chat_function, primary_service_id, primary_mode
 
     # Prepare kernel arguments with settings
     arguments = KernelArguments(settings=function_execution_settings)
-    arguments["chat_history"] = chat_history
     
     return chat_history, arguments
 
 
-async def chat_with_tutor(kernel, chat_function, chat_history, arguments, user_input):
+async def chat_with_tutor(kernel, chat_history, arguments, user_input):
     """Chat with the tutor and get a response."""
-    # Update the arguments with the user input
-    arguments["user_input"] = user_input
-    
-    # Invoke the chat function
-    result = await kernel.invoke(chat_function, arguments=arguments)
-    
-    # Update the chat history
+    # Send the conversation as structured messages: the system message and earlier
+    # turns form a prefix that is unchanged from the previous request
     chat_history.add_user_message(user_input)
-    chat_history.add_assistant_message(str(result))
-    
+
+    settings = next(iter(arguments.execution_settings.values()))
+    service = kernel.get_service(settings.service_id, type=ChatCompletionClientBase)
+
+    # Function calls made along the way (e.g. DeepReasoning) are added to chat_history
+    result = await service.get_chat_message_content(chat_history, settings, kernel=kernel, arguments=arguments)
+    chat_history.add_message(result)
+
+    # Keep the history bounded; it is trimmed in blocks so the prefix stays stable in between
+    trim_history(chat_history)
+
     return str(result)
 
 
-async def run_console_interface(kernel, chat_function, chat_history, arguments):
+async def run_console_interface(kernel, chat_history, arguments):
     """Run the console-based chat interface."""
     print("\n" + "="*50)
     print("Welcome to your AI Tutor chat!")
@@ -209,7 +193,7 @@ async def run_console_interface(kernel, chat_function, chat_history, arguments):
             break
             
         print("\nAI Tutor is thinking...")
-        response = await chat_with_tutor(kernel, chat_function, chat_history, arguments, user_input)
+        response = await chat_with_tutor(kernel, chat_history, arguments, user_input)
         print(f"\nAI Tutor: {response}")
 
 
@@ -228,13 +212,12 @@ async def main():
     
     # Create functions
     deep_reasoning_function = create_reasoning_function(kernel, secondary_service_id, secondary_model_id)
-    chat_function = create_chat_function(kernel, primary_service_id, primary_model_id)
     
     # Setup chat interface
-    chat_history, arguments = setup_chat_interface(kernel, chat_function, primary_service_id, primary_model_id)
+    chat_history, arguments = setup_chat_interface(kernel, primary_service_id, primary_model_id)
     
     # Run the console interface
-    await run_console_interface(kernel, chat_function, chat_history, arguments)
+    await run_console_interface(kernel, chat_history, arguments)
 
 
 if __name__ == "__main__":
@@ -2,19 +2,17 @@ import asyncio
 import os
 from dotenv import load_dotenv
 
-from semantic_kernel import Kernel
 from semantic_kernel.agents import AgentGroupChat, ChatCompletionAgent
-from semantic_kernel.agents.strategies import (
-    KernelFunctionSelectionStrategy,
-    KernelFunctionTerminationStrategy,
-)
-from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.agents.strategies import KernelFunctionSelectionStrategy
 from semantic_kernel.connectors.ai.function_choice_behavior import (
     FunctionChoiceBehavior,
 )
 from semantic_kernel.contents import ChatHistoryTruncationReducer
 from semantic_kernel.functions import KernelFunctionFromPrompt
 
+from service_factory import create_kernel
+from tutor_strategies import HeuristicTerminationStrategy
+
 """
 This sample demonstrates a streaming version of the AI Tutor Group Chat.
 It creates a chat interface where you can interact with a Tutor and a Reasoning 
@@ -49,35 +47,8 @@ def validate_environment():
 
 def setup_kernel_with_models():
     """Create and configure a kernel with both primary and secondary models."""
-    kernel = Kernel()
-
-    # Register the primary GPT-4o model for conversation
-    primary_model_id = os.getenv("AZURE_OPENAI_DEPLOYMENT_4o")
-    primary_service_id = "gpt4o"
-
-    kernel.add_service(
-        AzureChatCompletion(
-            service_id=primary_service_id,
-            deployment_name=primary_model_id,
-            api_key=os.getenv("AZURE_OPENAI_API_KEY_4o"),
-            endpoint=os.getenv("AZURE_OPENAI_ENDPOINT_4o")
-        )
-    )
-
-    # Register the secondary o1 model for deep reasoning
-    secondary_model_id = os.getenv("AZURE_OPENAI_DEPLOYMENT_o1")
-    secondary_service_id = "o1-model"
-
-    kernel.add_service(
-        AzureChatCompletion(
-            service_id=secondary_service_id,
-            deployment_name=secondary_model_id,
-            api_key=os.getenv("AZURE_OPENAI_API_KEY_o1"),
-            endpoint=os.getenv("AZURE_OPENAI_ENDPOINT_o1")
-        )
-    )
-    
-    return kernel
+    # Shared with the API: pooled keep-alive connections per endpoint
+    return create_kernel()
 
 async def main():
     # Load environment variables
@@ -108,6 +79,7 @@ Guidelines:
 - Suggest topics for the student to review based on their misunderstandings
 - Always maintain a helpful, tutoring tone
 - If a student's answer seems incorrect or confused, engage with the Reasoning agent to get a deeper analysis
+- To hand off to the Reasoning agent, address it as @Reasoning followed by what you need analyzed
 """,
         function_choice_behavior=FunctionChoiceBehavior.NoneInvoke(),
     )
@@ -190,8 +162,10 @@ RESPONSE:
             history_variable_name="lastmessage",
             history_reducer=history_reducer,
         ),
-        termination_strategy=KernelFunctionTerminationStrategy(
+        termination_strategy=HeuristicTerminationStrategy(
             agents=[tutor_agent],
+            reasoning_name=REASONING_NAME,
+            local_check=os.getenv("TUTOR_LOCAL_TERMINATION", "true").lower() == "true",
             function=termination_function,
             kernel=kernel,
             result_parser=lambda result: termination_keyword in str(result.value[0]).lower(),
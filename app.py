@@ -1,27 +1,113 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse, Response
+import time
+
+# Reference point for the startup timings reported by /ready
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Request, Header, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.websockets import WebSocketState
 import uvicorn
 import os
+import hmac
 import json
+import uuid
 import asyncio
+from contextlib import asynccontextmanager, suppress
 from dotenv import load_dotenv
-from pydantic import BaseModel
-from typing import List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional
+
+# Load environment variables before the tutor modules read their configuration
+load_dotenv()
 
 # Import our custom tutor pattern
-from tutor_pattern import process_chat_message, reset_chat
+from tutor_pattern import (
+    evaluate_quiz_batch,
+    get_startup_state,
+    initialize,
+    process_chat_message,
+    reset_chat,
+    get_cache_stats,
+    get_math_stats,
+    get_misconception_stats,
+    flush_misconception_hits,
+    list_misconceptions,
+    purge_misconceptions,
+    get_session_stats,
+    get_single_flight_stats,
+    get_strategy_stats,
+    get_turn_stats,
+    get_resume_stats,
+    get_history_stats,
+    get_prompt_usage_stats,
+    get_routing_stats,
+    check_chat_admission,
+    get_admission_control_stats,
+    get_endpoint_stats,
+    get_connection_pool_stats,
+    get_speculative_reasoning_stats,
+    get_history_version,
+    sync_history,
+    HistoryVersionMismatch,
+    resume_chat_message,
+)
+from admission import ServiceBusy
+from quiz_evaluator import QUIZ_CONCURRENCY
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics
+from service_factory import close_connection_pools
+from stream_coalescer import coalesce_chunks, get_coalescing_stats
 
-# Load environment variables
-load_dotenv()
+# Build the agents in the background at startup instead of at import (TUTOR_EAGER_INIT),
+# optionally pre-opening model connections (TUTOR_WARMUP)
+EAGER_INIT = os.getenv("TUTOR_EAGER_INIT", "true").lower() == "true"
+WARMUP = os.getenv("TUTOR_WARMUP", "false").lower() == "true"
+
+startup_timings: Dict[str, Optional[float]] = {
+    "import_ms": None,
+    "first_byte_ms": None,
+}
+
+def elapsed_since_import_ms() -> float:
+    return round((time.perf_counter() - IMPORT_STARTED) * 1000, 1)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start agent construction without blocking the server from accepting requests"""
+    init_task = asyncio.create_task(initialize(warm_up=WARMUP)) if EAGER_INIT else None
+    yield
+    if init_task and not init_task.done():
+        init_task.cancel()
+    flush_misconception_hits()
+    await close_connection_pools()
+
+class FirstByteTimer:
+    """ASGI middleware recording when the process sends its first response"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or startup_timings["first_byte_ms"] is not None:
+            return await self.app(scope, receive, send)
+        
+        async def send_and_record(message):
+            if message["type"] == "http.response.start" and startup_timings["first_byte_ms"] is None:
+                startup_timings["first_byte_ms"] = elapsed_since_import_ms()
+            await send(message)
+        
+        await self.app(scope, receive, send_and_record)
 
 # Initialize FastAPI 
 app = FastAPI(
     title="AI Tutor API",
     version="1.0",
-    description="Streaming AI Tutor API with FastAPI"
+    description="Streaming AI Tutor API with FastAPI",
+    lifespan=lifespan,
 )
 
+app.add_middleware(FirstByteTimer)
+
 # Add CORS middleware to handle cross-origin requests
 app.add_middleware(
     CORSMiddleware,
@@ -37,33 +123,240 @@ class ChatMessage(BaseModel):
     content: str
 
 class ChatRequest(BaseModel):
-    messages: List[ChatMessage]
+    # Full mode: the whole conversation, ending with the new user message
+    messages: List[ChatMessage] = []
+    session_id: Optional[str] = None
+    # Delta mode: only the new message, plus the history version the client last received
+    message: Optional[str] = None
+    history_version: Optional[int] = None
+    # Full mode after a resync event: replace the server's history with the client's messages
+    resync: bool = False
+    # Merge content chunks into one SSE frame per window / size (0 disables; server default if unset)
+    coalesce_ms: Optional[float] = None
+    coalesce_bytes: Optional[int] = None
+
+class ResetRequest(BaseModel):
+    session_id: Optional[str] = None
+
+class QuizSubmission(BaseModel):
+    question: str
+    ground_truth: str
+    student_answer: str
+    submission_id: Optional[str] = None
+
+class QuizBatchRequest(BaseModel):
+    submissions: List[QuizSubmission]
+    max_concurrency: Optional[int] = Field(default=None, ge=1, le=QUIZ_CONCURRENCY)
 
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {"status": "ok", "message": "AI Tutor API is running"}
 
-# Add a route to handle WebSocket connection attempts
-@app.get("/ws/{path:path}")
-async def handle_websocket(path: str):
-    """Handle WebSocket connection attempts with a proper response"""
-    return Response(
-        content=json.dumps({"error": "WebSocket connections not supported"}),
-        media_type="application/json",
-        status_code=404
+@app.get("/ready")
+async def ready():
+    """Readiness check: 200 once the agents are built (and warmed up, if enabled), 503 before"""
+    state = get_startup_state()
+    is_ready = state["agents_ready"] and (state["warmed_up"] or not WARMUP)
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"status": "ready" if is_ready else "starting", **state, **startup_timings},
     )
 
+@app.get("/metrics")
+async def metrics():
+    """Turn timings, iterations, token rates, in-flight streams and errors in Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/stats")
+async def stats():
+    """Runtime statistics for the tutor service"""
+    return {
+        "startup": {**get_startup_state(), **startup_timings},
+        "sessions": get_session_stats(),
+        "turns": get_turn_stats(),
+        "history": get_history_stats(),
+        "prompt_usage": get_prompt_usage_stats(),
+        "routing": get_routing_stats(),
+        "speculation": get_speculative_reasoning_stats(),
+        "admission": get_admission_control_stats(),
+        "endpoints": get_endpoint_stats(),
+        "connection_pools": get_connection_pool_stats(),
+        "stream_resume": get_resume_stats(),
+        "strategies": get_strategy_stats(),
+        "response_cache": get_cache_stats(),
+        "single_flight": get_single_flight_stats(),
+        "math_check": get_math_stats(),
+        "misconceptions": get_misconception_stats(),
+        "stream_coalescing": get_coalescing_stats(),
+    }
+
+def require_admin(admin_token: Optional[str]):
+    """Reject admin requests without the configured token; without TUTOR_ADMIN_TOKEN the admin routes are disabled"""
+    expected = os.getenv("TUTOR_ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (TUTOR_ADMIN_TOKEN is not set)")
+    if not admin_token or not hmac.compare_digest(admin_token, expected):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/admin/misconceptions")
+async def get_misconceptions(limit: int = 50, offset: int = 0, x_admin_token: Optional[str] = Header(None)):
+    """Inspect stored Reasoning diagnoses"""
+    require_admin(x_admin_token)
+    entries = await asyncio.to_thread(list_misconceptions, limit=limit, offset=offset)
+    return {"entries": entries, "stats": await asyncio.to_thread(get_misconception_stats)}
+
+@app.delete("/admin/misconceptions")
+async def delete_misconceptions(
+    key: Optional[str] = None,
+    older_than_seconds: Optional[float] = None,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """Purge stored Reasoning diagnoses (all, one key, or those older than a given age)"""
+    require_admin(x_admin_token)
+    deleted = await asyncio.to_thread(purge_misconceptions, key=key, older_than=older_than_seconds)
+    return {"status": "success", "deleted": deleted}
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Persistent chat connection carrying one session across many turns
+    
+    Client messages:
+        {"type": "message", "content": "..."}  start a turn with a new user message
+        {"type": "cancel"}                     stop the running turn
+        {"type": "reset"}                      stop the running turn and clear the chat
+    
+    Server messages:
+        {"session_id": "..."} once on connect, then for each turn the same
+        {"agent": ...} / {"content": ...} / {"error": ...} payloads as /chat/stream,
+        ending with {"done": true, "cancelled": bool}; {"reset": true} after a reset
+    """
+    await websocket.accept()
+    session_id = websocket.query_params.get("session_id") or str(uuid.uuid4())
+    await websocket.send_json({"session_id": session_id})
+    
+    turn: Optional[asyncio.Task] = None
+    stop: Optional[asyncio.Future] = None
+    closed = False
+    
+    async def run_turn(message: str, stop: asyncio.Future):
+        try:
+            last_agent = None
+            chunks = coalesce_chunks(process_chat_message(message, session_id, stop, resumable=False))
+            async for chunk in chunks:
+                if "error" in chunk:
+                    await websocket.send_json(error_payload(chunk))
+                    continue
+                if last_agent != chunk["agent"]:
+                    last_agent = chunk["agent"]
+                    await websocket.send_json({"agent": chunk["agent"]})
+                if chunk["content"]:
+                    await websocket.send_json({"content": chunk["content"]})
+            await websocket.send_json({"done": True, "cancelled": stop.done()})
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            # Only report errors to a client that is still there
+            if not closed and websocket.client_state == WebSocketState.CONNECTED:
+                with suppress(WebSocketDisconnect, RuntimeError, OSError):
+                    await websocket.send_json({"error": str(e)})
+    
+    async def stop_turn():
+        if stop is not None and not stop.done():
+            stop.set_result(True)
+        if turn is not None:
+            await turn
+    
+    try:
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+                kind = data.get("type", "message")
+            except (ValueError, AttributeError):
+                await websocket.send_json({"error": "Messages must be JSON objects"})
+                continue
+            
+            if kind == "message":
+                if turn is not None and not turn.done():
+                    await websocket.send_json({"error": "A response is still streaming; cancel it or wait for it to finish"})
+                    continue
+                content = data.get("content")
+                if not isinstance(content, str) or not content.strip():
+                    await websocket.send_json({"error": "Message content must be a non-empty string"})
+                    continue
+                try:
+                    check_chat_admission(content)
+                except ServiceBusy as e:
+                    await websocket.send_json(busy_payload(e))
+                    continue
+                stop = asyncio.get_running_loop().create_future()
+                turn = asyncio.create_task(run_turn(content, stop))
+            
+            elif kind == "cancel":
+                await stop_turn()
+            
+            elif kind == "reset":
+                await stop_turn()
+                await reset_chat(session_id)
+                await websocket.send_json({"reset": True})
+            
+            else:
+                await websocket.send_json({"error": f"Unknown message type: {kind}"})
+    
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # The client is gone: stop the agents and wait for the turn to unwind
+        closed = True
+        if stop is not None and not stop.done():
+            stop.set_result(True)
+        if turn is not None:
+            turn.cancel()
+            await asyncio.gather(turn, return_exceptions=True)
+
+def busy_payload(error: ServiceBusy) -> Dict[str, Any]:
+    """Event telling the client the tutor is at capacity and when to retry"""
+    return {"error": str(error), "busy": True, "retry_after": round(error.retry_after)}
+
+def error_payload(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """The client-facing part of an error chunk, including the busy flag and retry delay"""
+    return {key: chunk[key] for key in ("error", "busy", "retry_after") if key in chunk}
+
+def sse_event(payload: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    """Format one Server-Sent Event, with an id line when the event can be resumed from"""
+    id_line = f"id: {event_id}\n" if event_id else ""
+    return f"{id_line}data: {json.dumps(payload)}\n\n"
+
+async def watch_disconnect(request: Request, disconnected: asyncio.Future):
+    """Resolve `disconnected` as soon as the client closes the connection"""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+    if not disconnected.done():
+        disconnected.set_result(True)
+
 @app.post("/chat/stream")
-async def chat_stream(chat_request: ChatRequest):
-    """Endpoint for streaming chat responses from AI Tutor"""
+async def chat_stream(chat_request: ChatRequest, request: Request, last_event_id: Optional[str] = Header(None)):
+    """
+    Endpoint for streaming chat responses from AI Tutor
+    
+    A client that lost the connection can send the same request again with the
+    Last-Event-ID header to receive the rest of the turn instead of a new one.
     
-    # Extract the last user message from the conversation history
-    last_user_message = None
-    for msg in reversed(chat_request.messages):
-        if msg.role == "user":
-            last_user_message = msg.content
-            break
+    Clients can send only the new `message` with the `history_version` from the
+    previous turn's final event; if the server's history differs, it answers with
+    a resync event and the client sends the full `messages` with `resync` set.
+    """
+    
+    # Extract the new user message
+    last_user_message = chat_request.message
+    earlier_messages = []
+    if last_user_message is None:
+        for index in range(len(chat_request.messages) - 1, -1, -1):
+            if chat_request.messages[index].role == "user":
+                last_user_message = chat_request.messages[index].content
+                earlier_messages = chat_request.messages[:index]
+                break
     
     if not last_user_message:
         return StreamingResponse(
@@ -71,30 +364,78 @@ async def chat_stream(chat_request: ChatRequest):
             media_type="text/event-stream"
         )
     
+    if not last_event_id:
+        # Turn the request away at once when the model is at capacity, rather than queueing without bound
+        try:
+            check_chat_admission(last_user_message)
+        except ServiceBusy as e:
+            return StreamingResponse(
+                iter([sse_event(busy_payload(e)), "data: [DONE]\n\n"]),
+                media_type="text/event-stream",
+                status_code=429,
+                headers={"Retry-After": str(round(e.retry_after))},
+            )
+    
     async def generate():
+        # Stop the agents if the student closes the page mid-answer
+        disconnected = asyncio.get_running_loop().create_future()
+        watcher = asyncio.create_task(watch_disconnect(request, disconnected))
+        
         try:
-            # Process the message through our tutor system
-            last_agent = None
+            if last_event_id:
+                # Continue the interrupted turn from the buffer
+                resumed = resume_chat_message(last_event_id, chat_request.session_id, disconnected)
+                if resumed is None:
+                    yield sse_event({'error': 'The interrupted response is no longer available, please send your message again'})
+                    yield "data: [DONE]\n\n"
+                    return
+                last_agent, turn_chunks = resumed
+            else:
+                if chat_request.resync:
+                    await sync_history(chat_request.session_id, [msg.model_dump() for msg in earlier_messages])
+                
+                # Process the message through our tutor system
+                last_agent = None
+                turn_chunks = process_chat_message(
+                    last_user_message,
+                    chat_request.session_id,
+                    disconnected,
+                    history_version=chat_request.history_version if chat_request.message is not None else None,
+                )
             
-            async for chunk in process_chat_message(last_user_message):
+            chunks = coalesce_chunks(
+                turn_chunks,
+                window_ms=chat_request.coalesce_ms,
+                max_bytes=chat_request.coalesce_bytes,
+            )
+            async for chunk in chunks:
+                event_id = chunk.get("id")
                 if "error" in chunk:
-                    yield f"data: {json.dumps({'error': chunk['error']})}\n\n"
+                    yield sse_event(error_payload(chunk), event_id)
                     continue
                 
                 # If this is a new agent, send the agent name
                 if last_agent != chunk["agent"]:
                     last_agent = chunk["agent"]
-                    yield f"data: {json.dumps({'agent': chunk['agent']})}\n\n"
+                    yield sse_event({'agent': chunk['agent']}, None if chunk["content"] else event_id)
                 
                 # Send the content chunk
                 if chunk["content"]:
-                    yield f"data: {json.dumps({'content': chunk['content']})}\n\n"
+                    yield sse_event({'content': chunk['content']}, event_id)
             
-            # Send completion signal
-            yield "data: [DONE]\n\n"
+            # Send the new history version and the completion signal
+            if not disconnected.done():
+                yield sse_event({'history_version': get_history_version(chat_request.session_id)})
+                yield "data: [DONE]\n\n"
             
+        except HistoryVersionMismatch as e:
+            # Ask the client to send the full conversation
+            yield sse_event({'resync': True, 'history_version': e.server_version})
+            yield "data: [DONE]\n\n"
         except Exception as e:
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            watcher.cancel()
     
     return StreamingResponse(
         generate(),
@@ -102,16 +443,45 @@ async def chat_stream(chat_request: ChatRequest):
     )
 
 @app.post("/chat/reset")
-async def reset():
+async def reset(reset_request: Optional[ResetRequest] = None):
     """Reset the chat history"""
-    await reset_chat()
+    await reset_chat(reset_request.session_id if reset_request else None)
     return {"status": "success", "message": "Chat reset successfully"}
 
+@app.post("/quiz/evaluate/batch")
+async def quiz_evaluate_batch(batch_request: QuizBatchRequest):
+    """Grade a batch of quiz answers, streaming one NDJSON line per answer as it finishes"""
+    
+    async def generate():
+        start = time.perf_counter()
+        submissions = [submission.model_dump() for submission in batch_request.submissions]
+        
+        try:
+            async for result in evaluate_quiz_batch(submissions, batch_request.max_concurrency):
+                yield json.dumps(result) + "\n"
+            
+            # Send a summary line once every answer is graded
+            yield json.dumps({
+                "done": True,
+                "count": len(submissions),
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            }) + "\n"
+            
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson"
+    )
+
 @app.post("/chat")
 async def chat(chat_request: ChatRequest):
     """Endpoint for non-streaming chat responses - not recommended for tutor agent"""
     return {"error": "Please use the streaming endpoint /chat/stream for better experience with the AI Tutor"}
 
+startup_timings["import_ms"] = elapsed_since_import_ms()
+
 if __name__ == "__main__":
     # Configure logging to reduce noise from 404s
     log_config = uvicorn.config.LOGGING_CONFIG
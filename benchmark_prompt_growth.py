@@ -0,0 +1,102 @@
+"""
+Prompt size per turn for the console tutor: flattened history vs. windowed structured messages.
+
+Runs offline (no model calls). Each simulated turn adds a user message and a
+tutor reply of fixed size, then reports the estimated prompt tokens sent for
+the next turn by:
+
+- flattened: the previous `Chat` prompt, which rendered the whole history into
+  one string every turn (grows linearly per turn, so total cost is quadratic)
+- windowed: the structured messages sent by `chat_with_tutor` after
+  `trim_history` (flat once the window is full)
+- reused: how many of the windowed prompt's leading tokens are identical to the
+  previous request, i.e. eligible for provider-side prompt caching
+
+Usage:
+    python benchmark_prompt_growth.py --turns 40 --max-turns 8
+"""
+import argparse
+import asyncio
+
+from semantic_kernel import Kernel
+from semantic_kernel.contents import ChatHistory
+from semantic_kernel.functions import KernelArguments
+from semantic_kernel.prompt_template import InputVariable, KernelPromptTemplate, PromptTemplateConfig
+
+from ai_tutor_chat import get_system_message, trim_history
+from history_reducer import estimate_tokens, message_tokens
+
+FLATTENED_PROMPT = """{{$chat_history}}\nUser: {{$user_input}}\nTutor:"""
+
+USER_MESSAGE = "Can you check my answer? I said the capacitor charges to 63% of the supply after 2RC. " * 2
+TUTOR_MESSAGE = "Close! After one time constant (RC) a capacitor charges to about 63% of the supply voltage. " * 6
+
+
+def shared_prefix(previous, current) -> int:
+    """Number of leading messages that are the same in both requests."""
+    count = 0
+    for before, after in zip(previous, current):
+        if before.role != after.role or before.content != after.content:
+            break
+        count += 1
+    return count
+
+
+async def run(turns: int, max_turns: int):
+    kernel = Kernel()
+    template = KernelPromptTemplate(prompt_template_config=PromptTemplateConfig(
+        template=FLATTENED_PROMPT,
+        template_format="semantic-kernel",
+        input_variables=[
+            InputVariable(name="chat_history", is_required=True),
+            InputVariable(name="user_input", is_required=True),
+        ],
+    ))
+
+    full_history = ChatHistory()
+    full_history.add_system_message(get_system_message())
+    windowed_history = ChatHistory()
+    windowed_history.add_system_message(get_system_message())
+    previous = []
+
+    totals = {"flattened": 0, "windowed": 0, "reused": 0}
+    print(f"{'turn':>4}  {'flattened':>10}  {'windowed':>9}  {'reused':>7}")
+    for turn in range(1, turns + 1):
+        user_input = f"Turn {turn}: {USER_MESSAGE}"
+
+        rendered = await template.render(kernel, KernelArguments(chat_history=full_history, user_input=user_input))
+        flattened = estimate_tokens(rendered)
+
+        windowed_history.add_user_message(user_input)
+        current = list(windowed_history.messages)
+        windowed = sum(message_tokens(m) for m in current)
+        reused = sum(message_tokens(m) for m in current[:shared_prefix(previous, current)])
+
+        print(f"{turn:>4}  {flattened:>10}  {windowed:>9}  {reused:>7}")
+        totals["flattened"] += flattened
+        totals["windowed"] += windowed
+        totals["reused"] += reused
+
+        reply = f"Turn {turn}: {TUTOR_MESSAGE}"
+        full_history.add_user_message(user_input)
+        full_history.add_assistant_message(reply)
+        windowed_history.add_assistant_message(reply)
+        previous = list(windowed_history.messages)
+        trim_history(windowed_history, max_turns=max_turns)
+
+    print(
+        f"\ntotal prompt tokens over {turns} turns: flattened {totals['flattened']}, "
+        f"windowed {totals['windowed']} ({totals['reused']} reusable from the previous request)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=40, help="Number of turns to simulate")
+    parser.add_argument("--max-turns", type=int, default=8, help="Turns kept before the history is trimmed")
+    args = parser.parse_args()
+    asyncio.run(run(args.turns, args.max_turns))
+
+
+if __name__ == "__main__":
+    main()
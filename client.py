@@ -2,6 +2,7 @@ import streamlit as st
 import requests
 import json
 import time
+import uuid
 
 st.set_page_config(page_title="AI Tutor Chat", page_icon="🧠")
 
@@ -9,9 +10,102 @@ st.set_page_config(page_title="AI Tutor Chat", page_icon="🧠")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Identify this browser session's conversation to the server
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
+# Number of turns the server holds for this conversation, sent with each new message
+if "history_version" not in st.session_state:
+    st.session_state.history_version = 0
+
+# Reuse one pooled HTTP connection to the API across turns
+if "http" not in st.session_state:
+    st.session_state.http = requests.Session()
+
+# Per-agent timings of the last response, shown in the optional stats panel
+if "stream_stats" not in st.session_state:
+    st.session_state.stream_stats = []
+
+# Redraw the streaming response at most this often (15 fps)
+RENDER_INTERVAL = 1 / 15
+
+# Times a dropped stream is resumed (with Last-Event-ID) before giving up
+MAX_RESUME_ATTEMPTS = 3
+
+def estimate_tokens(text):
+    """Estimate a text's token count the way the server does (about four characters per token)."""
+    return (len(text) + 3) // 4 if text else 0
+
+def stream_events(payload, last_event_id=None):
+    """
+    POST a chat request and yield each Server-Sent Event as it arrives.
+    
+    Args:
+        payload (dict): The chat request.
+        last_event_id (str): Id of the last event received, to resume an interrupted turn.
+    
+    Yields:
+        tuple: The event's id (or None) and its decoded data.
+    """
+    headers = {'Accept': 'text/event-stream'}
+    if last_event_id:
+        headers['Last-Event-ID'] = last_event_id
+    
+    with st.session_state.http.post("http://localhost:8000/chat/stream", 
+                     json=payload, 
+                     stream=True,
+                     headers=headers) as response:
+        event_id = None
+        for line in response.iter_lines():
+            if not line:
+                continue
+            line = line.decode('utf-8')
+            if line.startswith('id:'):
+                event_id = line[3:].strip()
+            elif line.startswith('data:'):
+                data_str = line[5:].strip()
+                if data_str == "[DONE]":
+                    return
+                try:
+                    data = json.loads(data_str)
+                except json.JSONDecodeError:
+                    continue
+                yield event_id, data
+                event_id = None
+
+def summarize_segments(segments, request_start):
+    """
+    Turn raw per-agent timings into rows for the stats panel.
+    
+    Args:
+        segments (list): Timings recorded while streaming, one per agent switch.
+        request_start (float): perf_counter() value when the request was sent.
+    
+    Returns:
+        list: One dict per agent segment with time-to-first-token and tokens/sec.
+        Tokens are estimated from the text, since one frame may carry many of them.
+    """
+    rows = []
+    for segment in segments:
+        if segment["first_token"] is None:
+            continue
+        duration = segment["last_token"] - segment["first_token"]
+        rows.append({
+            "agent": segment["agent"],
+            "ttft_ms (from request)": round((segment["first_token"] - request_start) * 1000),
+            "ttft_ms (from agent start)": round((segment["first_token"] - segment["start"]) * 1000),
+            "tokens": segment["tokens"],
+            # The first frame starts the clock, so its tokens are not part of the rate
+            "tokens/sec": round((segment["tokens"] - segment["first_frame_tokens"]) / duration, 1) if duration > 0 else None,
+        })
+    return rows
+
 def send_message_stream(messages):
     """
-    Send messages to the AI Tutor API and stream the response.
+    Send the newest message to the AI Tutor API and stream the response.
+    
+    Only the new message is sent; the full conversation is sent once if the
+    server reports that its copy has diverged.
     
     Args:
         messages (list): List of message dictionaries with role and content.
@@ -21,51 +115,105 @@ def send_message_stream(messages):
     full_response = ""
     current_agent = None
     
+    # Re-render on a time budget rather than on every chunk
+    last_render = 0.0
+    rendered_length = 0
+    
+    # Timings for each agent's part of the response
+    request_start = time.perf_counter()
+    segments = []
+    
     # Format the request payload
     payload = {
-        "messages": [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+        "message": messages[-1]["content"],
+        "history_version": st.session_state.history_version,
+        "session_id": st.session_state.session_id,
     }
     
-    # Make streaming request
+    # Make streaming request, resuming from the last received event if the connection drops
+    last_event_id = None
+    attempt = 0
     try:
-        with requests.post("http://localhost:8000/chat/stream", 
-                         json=payload, 
-                         stream=True,
-                         headers={'Accept': 'text/event-stream'}) as response:
-            
-            # Process the streaming response
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    if line.startswith('data:'):
-                        data_str = line[5:].strip()
-                        if data_str == "[DONE]":
-                            break
+        while True:
+            resync = False
+            try:
+                for event_id, data in stream_events(payload, last_event_id):
+                    # The server's history differs from ours
+                    if 'resync' in data:
+                        resync = True
                         
-                        try:
-                            data = json.loads(data_str)
+                    if 'history_version' in data and 'resync' not in data:
+                        st.session_state.history_version = data['history_version']
+                    
+                    # Handle new agent identification
+                    if 'agent' in data:
+                        current_agent = data['agent']
+                        segments.append({
+                            "agent": current_agent,
+                            "start": time.perf_counter(),
+                            "first_token": None,
+                            "last_token": None,
+                            "tokens": 0,
+                            "first_frame_tokens": 0,
+                        })
+                        if full_response:
+                            # If we're switching agents, add a divider
+                            full_response += f"\n\n**{current_agent}**:\n"
+                        else:
+                            full_response += f"**{current_agent}**:\n"
                             
-                            # Handle new agent identification
-                            if 'agent' in data:
-                                current_agent = data['agent']
-                                if full_response:
-                                    # If we're switching agents, add a divider
-                                    full_response += f"\n\n**{current_agent}**:\n"
-                                else:
-                                    full_response += f"**{current_agent}**:\n"
-                                    
-                            # Handle content chunks
-                            if 'content' in data:
-                                full_response += data['content']
-                                # Update the placeholder with the accumulated response
-                                message_placeholder.markdown(full_response)
-                                
-                            # Handle errors
-                            if 'error' in data:
-                                st.error(f"Error: {data['error']}")
-                                
-                        except json.JSONDecodeError:
-                            continue
+                    # Handle content chunks
+                    if 'content' in data:
+                        full_response += data['content']
+                        now = time.perf_counter()
+                        if segments:
+                            segment = segments[-1]
+                            tokens = estimate_tokens(data['content'])
+                            if segment["first_token"] is None:
+                                segment["first_token"] = now
+                                segment["first_frame_tokens"] = tokens
+                            segment["last_token"] = now
+                            segment["tokens"] += tokens
+                        # Update the placeholder with the accumulated response
+                        if now - last_render >= RENDER_INTERVAL:
+                            message_placeholder.markdown(full_response)
+                            last_render, rendered_length = now, len(full_response)
+                        
+                    # Handle errors; "busy" means the server is at capacity and nothing was generated
+                    if data.get('busy'):
+                        st.warning(f"The tutor is busy right now. Please try again in {data.get('retry_after', 10)} seconds.")
+                    elif 'error' in data:
+                        st.error(f"Error: {data['error']}")
+                    
+                    # An event counts as received once it has been handled
+                    if event_id:
+                        last_event_id = event_id
+            
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
+                # Nothing received yet, or out of retries: report the failure
+                if not last_event_id or attempt == MAX_RESUME_ATTEMPTS:
+                    raise
+                attempt += 1
+                time.sleep(0.5 * attempt)
+                continue
+            
+            if resync and not payload.get("resync"):
+                # Send the whole conversation once so the server can rebuild its history
+                payload = {
+                    "messages": [{"role": msg["role"], "content": msg["content"]} for msg in messages],
+                    "session_id": st.session_state.session_id,
+                    "resync": True,
+                }
+                last_event_id = None
+                continue
+            
+            break
+        
+        # Draw whatever arrived since the last frame
+        if len(full_response) != rendered_length:
+            message_placeholder.markdown(full_response)
+        
+        st.session_state.stream_stats = summarize_segments(segments, request_start)
         
         # Return the full response once streaming is complete
         return full_response
@@ -77,10 +225,13 @@ def send_message_stream(messages):
 def reset_chat():
     """Reset the chat by clearing session state and calling reset endpoint."""
     try:
-        response = requests.post("http://localhost:8000/chat/reset")
+        response = st.session_state.http.post("http://localhost:8000/chat/reset",
+                                 json={"session_id": st.session_state.session_id})
         if response.status_code == 200:
             # Clear the session state
             st.session_state.messages = []
+            st.session_state.history_version = 0
+            st.session_state.stream_stats = []
             st.success("Chat reset successfully!")
         else:
             st.error("Failed to reset chat on server.")
@@ -97,6 +248,9 @@ def main():
         reset_chat()
         st.rerun()
     
+    # Optional timings for the last response
+    show_stats = st.sidebar.checkbox("Show stream stats", value=False)
+    
     # Display chat messages
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
@@ -117,6 +271,13 @@ def main():
             if response:
                 # Add assistant response to chat history
                 st.session_state.messages.append({"role": "assistant", "content": response})
+    
+    if show_stats:
+        st.sidebar.subheader("Last response")
+        if st.session_state.stream_stats:
+            st.sidebar.table(st.session_state.stream_stats)
+        else:
+            st.sidebar.caption("No response yet.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,317 @@
+import os
+import time
+import asyncio
+from collections import Counter, deque
+from typing import Any, AsyncGenerator, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+import httpx
+from openai import APIConnectionError, APIStatusError
+from pydantic import Field
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+
+from admission import LimitedAzureChatCompletion, estimate_call_tokens
+
+# Send a duplicate request to a second endpoint when the first is slower than usual
+HEDGING_ENABLED = os.getenv("TUTOR_HEDGING", "true").lower() == "true"
+
+# Hedge delay before enough latencies are known, and its lower bound afterwards
+DEFAULT_HEDGE_DELAY_MS = float(os.getenv("TUTOR_HEDGE_DELAY_MS", "2000"))
+MIN_HEDGE_DELAY_MS = float(os.getenv("TUTOR_HEDGE_MIN_DELAY_MS", "200"))
+
+# Latencies kept per call kind, and how many are needed before the p95 is trusted
+LATENCY_SAMPLES = 200
+MIN_LATENCY_SAMPLES = 20
+
+# Consecutive failures that take an endpoint out of rotation, and for how long
+CIRCUIT_FAILURES = int(os.getenv("TUTOR_CIRCUIT_FAILURES", "5"))
+CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("TUTOR_CIRCUIT_COOLDOWN_SECONDS", "30"))
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Whether an error is the deployment's fault and worth retrying elsewhere:
+    timeouts, connection errors, 429 and 5xx.
+
+    Client errors (content filter, context length, invalid request) would fail
+    the same way on every deployment. The kernel wraps the OpenAI error, so
+    the whole cause chain is searched.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, APIStatusError):
+            return error.status_code in (408, 429) or error.status_code >= 500
+        if isinstance(error, (APIConnectionError, httpx.TransportError, asyncio.TimeoutError, ConnectionError)):
+            return True
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class CircuitBreaker:
+    """
+    Takes an endpoint out of rotation after consecutive failures.
+
+    After the cooldown one trial call is let through (half open); its success
+    puts the endpoint back, its failure opens the circuit again.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURES, cooldown: float = CIRCUIT_COOLDOWN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def available(self) -> bool:
+        """Whether a call may be sent now (without claiming the half-open trial)."""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._trial_running)
+
+    def claim(self):
+        """Mark a call as started; in the half-open state it is the one trial call."""
+        if self.state != "closed":
+            self._trial_running = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+        self._trial_running = False
+
+    def record_abandoned(self):
+        """A call was cancelled before it succeeded or failed (e.g. it lost a hedge)."""
+        self._trial_running = False
+
+
+class Endpoint:
+    """One Azure deployment serving a logical model."""
+
+    def __init__(self, name: str, service: AzureChatCompletion):
+        self.name = name
+        self.service = service
+        self.breaker = CircuitBreaker()
+        # Moving average of time to first result, used to prefer the faster endpoint
+        self.latency_ms: Optional[float] = None
+        self.stats: Counter = Counter()
+
+    def record_latency(self, elapsed_ms: float):
+        self.latency_ms = elapsed_ms if self.latency_ms is None else 0.8 * self.latency_ms + 0.2 * elapsed_ms
+
+
+class _Attempt:
+    """A request in flight to one endpoint, racing for the first result."""
+
+    def __init__(self, endpoint: Endpoint, first: Awaitable, stream: Optional[AsyncGenerator] = None):
+        endpoint.breaker.claim()
+        endpoint.stats["requests"] += 1
+        self.endpoint = endpoint
+        self.stream = stream
+        self.started = time.monotonic()
+        self.task = asyncio.ensure_future(first)
+        # Set when a stream ended before producing anything
+        self.exhausted = False
+
+    @property
+    def result(self) -> Any:
+        return self.task.result()
+
+
+class HedgedAzureChatCompletion(LimitedAzureChatCompletion):
+    """
+    A chat completion service backed by several deployments of the same model.
+
+    Each call goes to the fastest endpoint whose circuit is closed. If it has
+    not produced its first result (the first streamed chunk, or the whole
+    response) within the p95 of recent calls, a duplicate is sent to the next
+    endpoint; whichever answers first is used and the other is cancelled. A
+    request that fails with a transient error fails over to the next
+    endpoint; client errors are raised as they are.
+    """
+
+    endpoints: List[Endpoint] = Field(default_factory=list, exclude=True)
+    latency_samples: Dict[str, Deque[float]] = Field(default_factory=dict, exclude=True)
+    hedge_stats: Counter = Field(default_factory=Counter, exclude=True)
+
+    def __init__(self, *, service_id: str, endpoints: List[Endpoint]):
+        # The service's own client is the first endpoint's, so it only differs in how calls are sent
+        super().__init__(
+            service_id=service_id,
+            deployment_name=endpoints[0].service.ai_model_id,
+            async_client=endpoints[0].service.client,
+        )
+        self.endpoints = endpoints
+        self.latency_samples = {"stream": deque(maxlen=LATENCY_SAMPLES), "call": deque(maxlen=LATENCY_SAMPLES)}
+        self.hedge_stats = Counter()
+        # Losing requests are cancelled in the background so the winner is not held up
+        self._cleanup_tasks: Set[asyncio.Task] = set()
+        hedged_services[service_id] = self
+
+    def hedge_delay(self, kind: str) -> float:
+        """Seconds to wait for the first endpoint before hedging: the recent p95, once known."""
+        samples = self.latency_samples[kind]
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return DEFAULT_HEDGE_DELAY_MS / 1000
+        p95 = sorted(samples)[int(0.95 * (len(samples) - 1))]
+        return max(MIN_HEDGE_DELAY_MS, p95) / 1000
+
+    def _ordered_endpoints(self) -> List[Endpoint]:
+        """Endpoints in rotation, fastest first; if none is, the one that failed longest ago."""
+        available = [endpoint for endpoint in self.endpoints if endpoint.breaker.available()]
+        if not available:
+            self.hedge_stats["all_circuits_open"] += 1
+            return [min(self.endpoints, key=lambda endpoint: endpoint.breaker.opened_at or 0.0)]
+        return sorted(available, key=lambda endpoint: endpoint.latency_ms if endpoint.latency_ms is not None else 0.0)
+
+    async def _first_result(self, kind: str, open_attempt: Callable[[Endpoint], _Attempt]) -> _Attempt:
+        """Race requests across endpoints and return the attempt that produced the first result."""
+        backups = self._ordered_endpoints()
+        attempts = [open_attempt(backups.pop(0))]
+        hedge_after = self.hedge_delay(kind) if HEDGING_ENABLED and backups else None
+        self.hedge_stats["calls"] += 1
+        last_error: Optional[BaseException] = None
+
+        try:
+            while attempts:
+                done, _ = await asyncio.wait(
+                    {attempt.task for attempt in attempts},
+                    timeout=hedge_after,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # The first endpoint is slower than usual: race it against the next one
+                    self.hedge_stats["hedged"] += 1
+                    attempts.append(open_attempt(backups.pop(0)))
+                    hedge_after = None
+                    continue
+
+                for attempt in [attempt for attempt in attempts if attempt.task in done]:
+                    error = attempt.task.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        attempt.exhausted = error is not None
+                        return self._finish_race(kind, attempt, attempts)
+                    if not is_transient(error):
+                        # The request itself is at fault: no other deployment would accept it
+                        self.hedge_stats["client_errors"] += 1
+                        raise error
+                    attempt.endpoint.breaker.record_failure()
+                    attempt.endpoint.stats["failures"] += 1
+                    last_error = error
+                    attempts.remove(attempt)
+
+                if not attempts and backups:
+                    # Every request so far failed: fail over to the next endpoint
+                    self.hedge_stats["failovers"] += 1
+                    attempts.append(open_attempt(backups.pop(0)))
+                    hedge_after = None
+        except BaseException:
+            for attempt in attempts:
+                self._discard(attempt)
+            raise
+
+        raise last_error
+
+    def _finish_race(self, kind: str, winner: _Attempt, attempts: List[_Attempt]) -> _Attempt:
+        elapsed_ms = (time.monotonic() - winner.started) * 1000
+        winner.endpoint.breaker.record_success()
+        winner.endpoint.record_latency(elapsed_ms)
+        winner.endpoint.stats["wins"] += 1
+        self.latency_samples[kind].append(elapsed_ms)
+        if winner is not attempts[0]:
+            self.hedge_stats["backup_won"] += 1
+        for attempt in attempts:
+            if attempt is not winner:
+                self._discard(attempt)
+        return winner
+
+    def _discard(self, attempt: _Attempt):
+        """Cancel a request that is no longer needed."""
+        attempt.endpoint.breaker.record_abandoned()
+        attempt.task.cancel()
+
+        async def close():
+            await asyncio.gather(attempt.task, return_exceptions=True)
+            if attempt.stream is not None:
+                try:
+                    await attempt.stream.aclose()
+                except Exception:
+                    pass
+
+        task = asyncio.ensure_future(close())
+        self._cleanup_tasks.add(task)
+        task.add_done_callback(self._cleanup_tasks.discard)
+
+    async def _inner_get_chat_message_contents(self, chat_history, settings):
+        def open_attempt(endpoint: Endpoint) -> _Attempt:
+            # Each endpoint fills in its own request fields, so each gets its own settings copy
+            return _Attempt(endpoint, endpoint.service._inner_get_chat_message_contents(chat_history, settings.model_copy()))
+
+        async with self.limiter.slot(estimate_call_tokens(chat_history, settings)):
+            winner = await self._first_result("call", open_attempt)
+            return winner.result
+
+    async def _inner_get_streaming_chat_message_contents(self, chat_history, settings, function_invoke_attempt: int = 0):
+        def open_attempt(endpoint: Endpoint) -> _Attempt:
+            stream = endpoint.service._inner_get_streaming_chat_message_contents(
+                chat_history, settings.model_copy(), function_invoke_attempt
+            )
+            return _Attempt(endpoint, stream.__anext__(), stream)
+
+        async with self.limiter.slot(estimate_call_tokens(chat_history, settings)):
+            winner = await self._first_result("stream", open_attempt)
+            if winner.exhausted:
+                return
+            try:
+                yield winner.result
+                async for messages in winner.stream:
+                    yield messages
+            except Exception as error:
+                # Failing partway through still counts against the endpoint, unless the request was at fault
+                if is_transient(error):
+                    winner.endpoint.breaker.record_failure()
+                    winner.endpoint.stats["failures"] += 1
+                raise
+            finally:
+                await winner.stream.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.hedge_stats["calls"]
+        return {
+            **self.hedge_stats,
+            "hedge_ratio": self.hedge_stats["hedged"] / calls if calls else 0.0,
+            "hedge_delay_ms": {kind: round(self.hedge_delay(kind) * 1000) for kind in self.latency_samples},
+            "endpoints": {
+                endpoint.name: {
+                    **endpoint.stats,
+                    "circuit": endpoint.breaker.state,
+                    "times_opened": endpoint.breaker.times_opened,
+                    "latency_ms": round(endpoint.latency_ms, 1) if endpoint.latency_ms is not None else None,
+                }
+                for endpoint in self.endpoints
+            },
+        }
+
+
+# Services with more than one endpoint, by service id
+hedged_services: Dict[str, HedgedAzureChatCompletion] = {}
+
+
+def get_hedging_stats() -> Dict[str, Any]:
+    """Return hedging, failover and circuit state per multi-endpoint service."""
+    return {
+        "enabled": HEDGING_ENABLED,
+        "services": {service_id: service.stats() for service_id, service in sorted(hedged_services.items())},
+    }
@@ -0,0 +1,271 @@
+import asyncio
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, AsyncIterable, Dict, List, Optional
+
+from pydantic import Field
+from semantic_kernel import Kernel
+from semantic_kernel.agents import ChatCompletionAgent
+from semantic_kernel.contents import AuthorRole, ChatHistory, ChatHistoryReducer, ChatMessageContent, StreamingChatMessageContent
+from semantic_kernel.functions import KernelArguments, KernelFunctionFromPrompt
+
+from prompt_usage import record_usage
+
+# Process-wide counters for history reduction and background summaries
+history_stats: Counter = Counter()
+
+# Rough size of a message beyond its text (role, name, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a tutoring conversation between a student and AI tutors.
+Update the summary with the new messages below. Keep what the student is working on,
+the questions asked, the answers they gave, the misconceptions found and what was explained.
+Write at most 150 words of plain prose.
+
+CURRENT SUMMARY:
+{{$summary}}
+
+NEW MESSAGES:
+{{$messages}}
+"""
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Estimate a text's token count (about four characters per token for English)."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def message_tokens(message: ChatMessageContent) -> int:
+    return estimate_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _clip(message: ChatMessageContent, max_tokens: int) -> ChatMessageContent:
+    """Shorten an oversized message to its beginning and end."""
+    half = max(1, max_tokens * 4 // 2)
+    content = message.content or ""
+    if len(content) <= 2 * half:
+        return message
+    return ChatMessageContent(
+        role=message.role,
+        name=message.name,
+        content=f"{content[:half]}\n[...]\n{content[-half:]}",
+    )
+
+
+def _same_message(message: ChatMessageContent, other: Optional[ChatMessageContent]) -> bool:
+    """Whether two messages have the same author and text (agent channels hold their own copies)."""
+    return other is not None and (message.role, message.name, message.content) == (other.role, other.name, other.content)
+
+
+class RollingSummary:
+    """
+    Summary of the messages that fell out of a conversation's token budget.
+
+    The summary is updated in a background task after a turn finishes, so
+    reducing the history never waits for a model call.
+    """
+
+    def __init__(self, kernel: Optional[Kernel]):
+        self.kernel = kernel
+        self.function = KernelFunctionFromPrompt(function_name="summary", prompt=SUMMARY_PROMPT)
+        self.text = ""
+        # Number of leading history messages folded into the summary
+        self.covered = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def reset(self):
+        """Forget the summary, e.g. when the history is cleared or replaced."""
+        if self._task is not None:
+            self._task.cancel()
+        self._task = None
+        self.text = ""
+        self.covered = 0
+
+    def schedule(self, messages: List[ChatMessageContent], window_start: int):
+        """Fold messages[covered:window_start] into the summary in the background, if not already running."""
+        if self.covered > len(messages):
+            self.reset()
+        if self.kernel is None or window_start <= self.covered:
+            return
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._update(list(messages[self.covered:window_start]), window_start))
+
+    async def _update(self, messages: List[ChatMessageContent], covered: int):
+        transcript = "\n".join(
+            f"{message.name or message.role.value}: {message.content}" for message in messages if message.content
+        )
+        try:
+            result = await self.function.invoke(
+                kernel=self.kernel,
+                arguments=KernelArguments(summary=self.text or "(none)", messages=transcript),
+            )
+        except Exception:
+            history_stats["summary_errors"] += 1
+            return
+        if result is None or not str(result).strip():
+            history_stats["summary_errors"] += 1
+            return
+        self.text = str(result).strip()
+        self.covered = covered
+        history_stats["summaries"] += 1
+
+
+class TokenBudgetReducer(ChatHistoryReducer):
+    """
+    Keeps system messages and the most recent turns within a token budget.
+
+    Older turns are replaced by the conversation's rolling summary (when one is
+    attached and has been computed). The window always starts at a user message
+    so a turn is never cut in half; if even the latest turn does not fit, its
+    oversized messages are clipped.
+
+    With `refill_ratio` below 1 the window does not slide forward every turn:
+    once it overflows, it is cut back to that fraction of the budget and then
+    only grows at the end. The reduced history is therefore append-only between
+    cuts, which keeps the prompt prefix byte-identical for provider prompt caching.
+    """
+
+    token_budget: int = Field(default=3000, gt=0)
+    target_count: int = Field(default=50, gt=0)
+    refill_ratio: float = Field(default=1.0, gt=0, le=1)
+    summary: Optional[RollingSummary] = Field(default=None, exclude=True)
+    # First message of the current window, to tell whether the history still starts it
+    anchor: Optional[ChatMessageContent] = Field(default=None, exclude=True)
+    anchor_index: int = Field(default=0, exclude=True)
+
+    def window_start(self, history: List[ChatMessageContent]) -> int:
+        """Index of the first message kept in full."""
+        budget = self.token_budget - sum(message_tokens(m) for m in history if m.role == AuthorRole.SYSTEM)
+        if self.summary is not None and self.summary.text:
+            budget -= estimate_tokens(self.summary.text) + MESSAGE_OVERHEAD_TOKENS
+
+        if self._window_fits(history, self.anchor_index, budget):
+            return self.anchor_index
+
+        start = self._latest_start(history, int(budget * self.refill_ratio), int(self.target_count * self.refill_ratio) or 1)
+        self.anchor_index = start
+        self.anchor = history[start] if start < len(history) else None
+        return start
+
+    def _window_fits(self, history: List[ChatMessageContent], start: int, budget: int) -> bool:
+        """Whether the window from `start` is still the one anchored and within both limits."""
+        if start > 0 and (start >= len(history) or not _same_message(history[start], self.anchor)):
+            return False
+        window = [m for m in history[start:] if m.role != AuthorRole.SYSTEM]
+        return len(window) <= self.target_count and sum(message_tokens(m) for m in window) <= budget
+
+    @staticmethod
+    def _latest_start(history: List[ChatMessageContent], budget: int, max_count: int) -> int:
+        """Earliest turn start from which the rest of the history fits `budget` and `max_count`."""
+        used = 0
+        turn_start = None
+        for index in range(len(history) - 1, -1, -1):
+            message = history[index]
+            if message.role == AuthorRole.SYSTEM:
+                continue
+            used += message_tokens(message)
+            if used > budget or len(history) - index > max_count:
+                break
+            if message.role == AuthorRole.USER:
+                turn_start = index
+        else:
+            # Everything fits
+            return 0
+
+        if turn_start is None:
+            # Not even the latest turn fits: keep it anyway, clipped by reduce()
+            turn_start = next(
+                (index for index in range(len(history) - 1, -1, -1) if history[index].role == AuthorRole.USER),
+                len(history) - 1,
+            )
+        return turn_start
+
+    async def reduce(self) -> Optional["TokenBudgetReducer"]:
+        history = self.messages
+        start = self.window_start(history)
+        total = sum(message_tokens(m) for m in history)
+        if start == 0 and total <= self.token_budget:
+            return None
+
+        system = [m for m in history[:start] if m.role == AuthorRole.SYSTEM]
+        window = [m for m in history[start:] if m.role != AuthorRole.SYSTEM]
+        reduced: List[ChatMessageContent] = list(system)
+        if start > 0 and self.summary is not None and self.summary.text:
+            reduced.append(ChatMessageContent(
+                role=AuthorRole.SYSTEM,
+                content=f"Summary of the earlier conversation: {self.summary.text}",
+            ))
+
+        # Share what is left of the budget among the window's messages
+        remaining = self.token_budget - sum(message_tokens(m) for m in reduced)
+        if sum(message_tokens(m) for m in window) > remaining:
+            per_message = max(64, remaining // max(1, len(window)))
+            window = [_clip(m, per_message) for m in window]
+        reduced.extend(window)
+
+        history_stats["reductions"] += 1
+        history_stats["messages_dropped"] += start - len(system)
+        history_stats["tokens_before"] += total
+        history_stats["tokens_after"] += sum(message_tokens(m) for m in reduced)
+        self.messages = reduced
+        return self
+
+
+# The reducer for the conversation whose turn is running in the current task
+active_reducer: ContextVar[Optional[TokenBudgetReducer]] = ContextVar("active_reducer", default=None)
+
+
+class ReducingChatCompletionAgent(ChatCompletionAgent):
+    """
+    A ChatCompletionAgent that sends the model the active conversation's
+    reduced history instead of all of it, and records the token usage the
+    model reports.
+
+    Agents are shared across sessions, so the reducer comes from the
+    `active_reducer` context variable set for the running turn.
+    """
+
+    async def invoke_stream(
+        self,
+        history: ChatHistory,
+        arguments: Any = None,
+        kernel: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterable[StreamingChatMessageContent]:
+        """Stream a response to the reduced history, adding new messages to the full one."""
+        reducer = active_reducer.get()
+        reduced = None
+        if reducer is not None:
+            reducer.messages = history.messages
+            reduced = await reducer.reduce()
+
+        if reduced is None:
+            async for response in self._invoke_stream_recording_usage(history, arguments, kernel, **kwargs):
+                yield response
+            return
+
+        working = ChatHistory(messages=list(reduced.messages))
+        start = len(working.messages)
+        async for response in self._invoke_stream_recording_usage(working, arguments, kernel, **kwargs):
+            yield response
+
+        for message in working.messages[start:]:
+            history.add_message(message)
+
+    async def _invoke_stream_recording_usage(
+        self, history: ChatHistory, arguments: Any, kernel: Any, **kwargs: Any
+    ) -> AsyncIterable[StreamingChatMessageContent]:
+        """Stream from the model, recording the prompt and cached tokens it reports."""
+        async for response in super().invoke_stream(history, arguments, kernel, **kwargs):
+            record_usage(self.name, response)
+            yield response
+
+
+def get_history_stats() -> Dict[str, Any]:
+    """Return history reduction and summary counters."""
+    stats = dict(history_stats)
+    before = history_stats["tokens_before"]
+    stats["token_reduction_ratio"] = 1 - history_stats["tokens_after"] / before if before else 0.0
+    return stats
@@ -0,0 +1,274 @@
+import re
+import ast
+import operator
+from collections import Counter
+from fractions import Fraction
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Notes added to the user's message so the agents (and the strategies) see the result
+VERIFIED_CORRECT_MARKER = "[Math check: correct]"
+VERIFIED_INCORRECT_MARKER = "[Math check: incorrect]"
+
+# Process-wide counters for the local math check
+math_check_stats: Counter = Counter()
+
+_ANSWER_PATTERN = re.compile(
+    r"(?:my answer is|my answer was|my answer:|i got|i get|i think it'?s|i think it is|i said|answer\s*[:=]|answer is)\s*(?P<answer>.+?)\s*\.?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_PROBLEM_PATTERN = re.compile(
+    r"(?:what is|what's|calculate|compute|evaluate|simplify|expand|solve(?:\s+for\s+[a-z])?)\s*:?\s*(?P<problem>[^?]+?)\s*(?:\?|\.\s|,|;|$)",
+    re.IGNORECASE,
+)
+
+_BINARY_OPERATORS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+# Points used to compare expressions in one variable
+_SAMPLE_POINTS = [Fraction(-3, 2), Fraction(-1), Fraction(0), Fraction(2), Fraction(7, 3), Fraction(5)]
+
+_MAX_EXPONENT = 12
+
+# A single decimal number, optionally as "x = 2.33"
+_DECIMAL_ANSWER = re.compile(r"^(?:[a-zA-Z]\s*=\s*)?[-+]?\d*\.(?P<decimals>\d+)\.?$")
+
+
+class MathCheck:
+    """The outcome of checking a numeric or algebraic answer locally."""
+
+    def __init__(self, kind: str, problem: str, student_answer: str, is_correct: bool, expected: Optional[str] = None):
+        self.kind = kind
+        self.problem = problem
+        self.student_answer = student_answer
+        self.is_correct = is_correct
+        self.expected = expected
+
+    def as_note(self) -> str:
+        """Render the result as a note for the Tutor's context."""
+        if self.is_correct:
+            return (
+                f"{VERIFIED_CORRECT_MARKER} The answer {self.student_answer} to {self.problem} "
+                f"was verified as correct; no further analysis is needed."
+            )
+        expected = f" The expected answer is {self.expected}." if self.expected else ""
+        return (
+            f"{VERIFIED_INCORRECT_MARKER} The answer {self.student_answer} to {self.problem} "
+            f"was verified as incorrect.{expected}"
+        )
+
+
+def _to_python(text: str) -> str:
+    """Rewrite textbook notation (2x, 3(x+1), x^2, ×, ÷) as a Python expression."""
+    text = text.strip().rstrip(".")
+    text = text.replace("^", "**").replace("×", "*").replace("·", "*").replace("÷", "/").replace("−", "-")
+    text = re.sub(r"(?<=\d),(?=\d{3}\b)", "", text)
+    # Implicit multiplication: 2x, 2(, )(, )x, x(
+    text = re.sub(r"(\d)\s*([a-zA-Z(])", r"\1*\2", text)
+    text = re.sub(r"\)\s*([\w(])", r")*\1", text)
+    text = re.sub(r"\b([a-zA-Z])\s*\(", r"\1*(", text)
+    return text
+
+
+def _evaluate(node: ast.AST, variables: Dict[str, Fraction]) -> Fraction:
+    """Evaluate a restricted arithmetic AST exactly."""
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body, variables)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return Fraction(node.value).limit_denominator(10**9)
+    if isinstance(node, ast.Name) and node.id in variables:
+        return variables[node.id]
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _evaluate(node.operand, variables)
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp):
+        left = _evaluate(node.left, variables)
+        right = _evaluate(node.right, variables)
+        if isinstance(node.op, ast.Pow):
+            if right.denominator != 1 or abs(right) > _MAX_EXPONENT:
+                raise ValueError("Unsupported exponent")
+            return left ** int(right)
+        operation = _BINARY_OPERATORS.get(type(node.op))
+        if operation is not None:
+            return operation(left, right)
+    raise ValueError(f"Unsupported expression element: {ast.dump(node)}")
+
+
+def _parse(text: str) -> Optional[ast.Expression]:
+    try:
+        return ast.parse(_to_python(text), mode="eval")
+    except SyntaxError:
+        return None
+
+
+def _variables(tree: ast.AST) -> set:
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+
+def _format_number(value: Fraction) -> str:
+    if value.denominator == 1:
+        return str(value.numerator)
+    return f"{value.numerator}/{value.denominator}"
+
+
+def _answer_value(answer: str) -> Optional[Fraction]:
+    """Parse a numeric answer such as '11', '-2.5', '3/4' or 'x = 5'."""
+    answer = re.sub(r"^[a-zA-Z]\s*=\s*", "", answer.strip())
+    tree = _parse(answer)
+    if tree is None or _variables(tree):
+        return None
+    try:
+        return _evaluate(tree, {})
+    except (ValueError, ZeroDivisionError, OverflowError):
+        return None
+
+
+def _rounding_tolerance(answer: str) -> Fraction:
+    """
+    How far a numeric answer may be from the exact value: half a unit in its
+    last decimal place (0.33 -> 0.005), or nothing for integers and fractions.
+    """
+    match = _DECIMAL_ANSWER.match(answer.strip())
+    if not match:
+        return Fraction(0)
+    return Fraction(1, 2 * 10 ** len(match.group("decimals")))
+
+
+def _close(answer: Fraction, expected: Fraction, tolerance: Fraction) -> bool:
+    """Exact match, or agreement to the precision of a rounded decimal answer."""
+    return abs(answer - expected) <= tolerance
+
+
+def _check_equation(problem: str, answer: str) -> Optional[MathCheck]:
+    left_text, _, right_text = problem.partition("=")
+    left, right = _parse(left_text), _parse(right_text)
+    if left is None or right is None:
+        return None
+    names = _variables(left) | _variables(right)
+    if len(names) != 1:
+        return None
+    name = names.pop()
+
+    value = _answer_value(answer)
+    if value is None:
+        return None
+
+    def residual(x: Fraction) -> Fraction:
+        return _evaluate(left, {name: x}) - _evaluate(right, {name: x})
+
+    # Report the solution when the equation is linear
+    solution = None
+    at_zero, at_one, at_two = residual(Fraction(0)), residual(Fraction(1)), residual(Fraction(2))
+    slope = at_one - at_zero
+    if slope != 0 and at_two - at_one == slope:
+        solution = -at_zero / slope
+
+    tolerance = _rounding_tolerance(answer)
+    if residual(value) == 0:
+        is_correct = True
+    elif tolerance and solution is None:
+        # A rounded decimal cannot be told apart from a wrong one without the exact solution
+        return None
+    else:
+        is_correct = solution is not None and _close(value, solution, tolerance)
+
+    expected = f"{name} = {_format_number(solution)}" if solution is not None else None
+    return MathCheck("equation", problem, answer, is_correct, expected)
+
+
+def _check_expression(problem: str, answer: str) -> Optional[MathCheck]:
+    problem_tree, answer_tree = _parse(problem), _parse(answer)
+    if problem_tree is None or answer_tree is None:
+        return None
+    problem_names, answer_names = _variables(problem_tree), _variables(answer_tree)
+    # Words and units ("four", "3 dollars", "12 cm") parse as names: not checkable
+    if not answer_names <= problem_names or any(len(name) > 1 for name in problem_names):
+        return None
+    names = problem_names
+    if len(names) > 1:
+        return None
+
+    if not names:
+        expected = _evaluate(problem_tree, {})
+        is_correct = _close(_evaluate(answer_tree, {}), expected, _rounding_tolerance(answer))
+        return MathCheck("arithmetic", problem, answer, is_correct, _format_number(expected))
+
+    # Same polynomial/rational function if it agrees at every sample point
+    name = names.pop()
+    is_correct = all(
+        _evaluate(problem_tree, {name: x}) == _evaluate(answer_tree, {name: x}) for x in _SAMPLE_POINTS
+    )
+    return MathCheck("expression", problem, answer, is_correct)
+
+
+def strip_math_note(message: str) -> str:
+    """Remove a note added by annotate_message, returning the student's original text."""
+    for marker in (VERIFIED_CORRECT_MARKER, VERIFIED_INCORRECT_MARKER):
+        index = message.find(f"\n\n{marker}")
+        if index != -1:
+            return message[:index]
+    return message
+
+
+def split_question_answer(message: str) -> Optional[Tuple[str, str]]:
+    """
+    Split a student's message into the question and the answer they gave.
+
+    Returns:
+        (question, answer), or None if the message does not contain an answer
+    """
+    answer_match = _ANSWER_PATTERN.search(strip_math_note(message))
+    if not answer_match:
+        return None
+    question = message[:answer_match.start()].strip()
+    answer = answer_match.group("answer").strip()
+    if not question or not answer:
+        return None
+    return question, answer
+
+
+def check_math_answer(message: str) -> Optional[MathCheck]:
+    """
+    Find a numeric/algebraic problem and the student's answer in `message` and check it.
+
+    Returns:
+        The MathCheck, or None if the message is not a checkable math answer
+    """
+    answer_match = _ANSWER_PATTERN.search(message)
+    if not answer_match:
+        return None
+    problem_match = _PROBLEM_PATTERN.search(message[:answer_match.start()])
+    if not problem_match:
+        return None
+
+    problem = problem_match.group("problem").strip()
+    answer = answer_match.group("answer").strip()
+    try:
+        if "=" in problem:
+            result = _check_equation(problem, answer)
+        else:
+            result = _check_expression(problem, answer)
+    except (ValueError, ZeroDivisionError, OverflowError, RecursionError):
+        result = None
+
+    if result is None:
+        math_check_stats["not_checkable"] += 1
+    else:
+        math_check_stats["correct" if result.is_correct else "incorrect"] += 1
+    return result
+
+
+def annotate_message(message: str) -> str:
+    """Append the local math check's result to a student's message, if it applies."""
+    result = check_math_answer(message)
+    if result is None:
+        return message
+    return f"{message}\n\n{result.as_note()}"
+
+
+def get_math_check_stats() -> Dict[str, Any]:
+    """Return how many answers were checked locally and with what outcome."""
+    return dict(math_check_stats)
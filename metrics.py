@@ -0,0 +1,250 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from semantic_kernel.contents import ChatMessageContent
+
+from history_reducer import estimate_tokens
+
+# Record turn timings for /metrics; recording is a few additions per chunk, the
+# text is only built when the endpoint is scraped
+METRICS_ENABLED = os.getenv("TUTOR_METRICS", "true").lower() == "true"
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+FAST_LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0)
+ITERATION_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10)
+TOKEN_RATE_BUCKETS = (5, 10, 20, 40, 60, 80, 120, 160, 250, 400)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """A named metric with optional labels, rendered in the Prometheus text format."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        metrics.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """The metric's sample lines."""
+
+
+class CounterMetric(Metric):
+    """A monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        if not METRICS_ENABLED:
+            return
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(self.label_names, values)} {_number(value)}"
+            for values, value in sorted(self._values.items())
+        ]
+
+
+class GaugeMetric(Metric):
+    """A value that goes up and down."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self.value = 0
+
+    def inc(self):
+        self.value += 1
+
+    def dec(self):
+        self.value -= 1
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name} {_number(self.value)}"]
+
+
+class HistogramMetric(Metric):
+    """
+    Observations counted into buckets per label set.
+
+    Each observation increments one bucket; the cumulative counts Prometheus
+    expects are only summed up when rendering.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # Label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        if not METRICS_ENABLED:
+            return
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for values, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = f'le="{bound if bound == "+Inf" else _number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, values)} {count}")
+        return lines
+
+
+# Every metric, in the order they are rendered
+metrics: List[Metric] = []
+
+time_to_first_token = HistogramMetric(
+    "tutor_time_to_first_token_seconds",
+    "Time the student waits for an agent's first token: from the turn start, or the previous response's last token.",
+    LATENCY_BUCKETS,
+    labels=("agent",),
+)
+selection_latency = HistogramMetric(
+    "tutor_selection_seconds",
+    "Time to pick the next agent, by local rules or a model call.",
+    FAST_LATENCY_BUCKETS,
+    labels=("path",),
+)
+termination_latency = HistogramMetric(
+    "tutor_termination_seconds",
+    "Time to decide whether a turn is done, by local rules or a model call.",
+    FAST_LATENCY_BUCKETS,
+    labels=("path",),
+)
+turn_iterations = HistogramMetric(
+    "tutor_turn_iterations",
+    "Agent responses per chat turn.",
+    ITERATION_BUCKETS,
+)
+turn_latency = HistogramMetric(
+    "tutor_turn_seconds",
+    "Duration of a whole chat turn.",
+    LATENCY_BUCKETS,
+)
+tokens_per_second = HistogramMetric(
+    "tutor_tokens_per_second",
+    "Estimated output tokens per second of an agent response, from its first to its last token.",
+    TOKEN_RATE_BUCKETS,
+    labels=("agent",),
+)
+streams_in_flight = GaugeMetric(
+    "tutor_streams_in_flight",
+    "Chat turns currently streaming.",
+)
+errors = CounterMetric(
+    "tutor_errors_total",
+    "Chat turns that ended with an error, by type.",
+    labels=("type",),
+)
+
+
+class TurnMetrics:
+    """
+    Timings of one streamed chat turn, recorded as its chunks pass through.
+
+    First tokens and output rates are derived from the chunk stream itself, so
+    no agent or model code has to be instrumented. Agent responses are told
+    apart by the chat history, which grows by each response once it has
+    streamed, so consecutive responses by the same agent are counted too.
+    """
+
+    def __init__(self, history: List[ChatMessageContent]):
+        self.start = time.perf_counter()
+        self.history = history
+        self.history_length = len(history)
+        # When the student started waiting for the next agent's first token
+        self.waiting_since = self.start
+        self.agent: Optional[str] = None
+        self.first_token: Optional[float] = None
+        self.last_token: Optional[float] = None
+        self.tokens = 0
+        self.iterations = 0
+        streams_in_flight.inc()
+
+    def chunk(self, agent: str, content: Optional[str]):
+        """Record a chunk streamed by `agent`."""
+        if self.iterations == 0 or agent != self.agent or len(self.history) != self.history_length:
+            # The first chunk of a new agent response
+            self._finish_agent()
+            self.agent = agent
+            self.history_length = len(self.history)
+            self.iterations += 1
+        if not content:
+            return
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+            time_to_first_token.observe(now - self.waiting_since, agent)
+        self.last_token = now
+        self.tokens += estimate_tokens(content)
+
+    def error(self, error_type: str):
+        errors.inc(error_type)
+
+    def finish(self):
+        """Record the end of the turn."""
+        self._finish_agent()
+        turn_iterations.observe(self.iterations)
+        turn_latency.observe(time.perf_counter() - self.start)
+        streams_in_flight.dec()
+
+    def _finish_agent(self):
+        if self.first_token is not None:
+            elapsed = self.last_token - self.first_token
+            if elapsed > 0:
+                tokens_per_second.observe(self.tokens / elapsed, self.agent)
+            self.waiting_since = self.last_token
+        self.first_token = self.last_token = None
+        self.tokens = 0
+
+
+def render_metrics() -> str:
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,273 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from contextvars import ContextVar
+from functools import partial
+from typing import Any, AsyncIterable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import Field
+from semantic_kernel.contents import AuthorRole, ChatHistory, ChatMessageContent, StreamingChatMessageContent
+
+from model_router import RoutedChatCompletionAgent
+from math_verifier import split_question_answer
+from response_cache import normalize_message
+
+# When set, new diagnoses are collected here as pending writes instead of being
+# stored: a speculative analysis is only stored once it is actually used
+deferred_diagnoses: ContextVar[Optional[List[Callable[[], None]]]] = ContextVar("deferred_diagnoses", default=None)
+
+# Hits are counted in memory and written with the next write, or once this many diagnoses have pending hits
+HIT_FLUSH_THRESHOLD = int(os.getenv("TUTOR_MISCONCEPTION_HIT_FLUSH", "50"))
+
+# Expired and least recently used diagnoses are pruned once per this many new ones,
+# so the store may briefly hold up to this many more than max_entries
+PRUNE_INTERVAL = int(os.getenv("TUTOR_MISCONCEPTION_PRUNE_EVERY", "100"))
+
+
+class MisconceptionStore:
+    """
+    Persistent store of Reasoning diagnoses keyed by (question, wrong answer).
+
+    The same wrong answers come up across many students, so a diagnosis made
+    once can be reused instead of calling the Reasoning model again. Its
+    methods block on SQLite; async code calls them with asyncio.to_thread.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        enabled: Optional[bool] = None,
+    ):
+        """
+        Initialize the MisconceptionStore.
+
+        Args:
+            path: SQLite file holding the store
+                (defaults to TUTOR_MISCONCEPTION_DB or misconceptions.sqlite3)
+            ttl: Seconds a diagnosis stays valid
+                (defaults to TUTOR_MISCONCEPTION_TTL_SECONDS or 30 days)
+            max_entries: Maximum number of diagnoses kept, least recently used dropped first
+                (defaults to TUTOR_MISCONCEPTION_MAX_ENTRIES or 5000)
+            enabled: Whether diagnoses are stored and reused
+                (defaults to TUTOR_MISCONCEPTION_CACHE or true)
+        """
+        self.enabled = enabled if enabled is not None else os.getenv("TUTOR_MISCONCEPTION_CACHE", "true").lower() == "true"
+        self.path = path or os.getenv("TUTOR_MISCONCEPTION_DB", "misconceptions.sqlite3")
+        self.ttl = ttl if ttl is not None else float(os.getenv("TUTOR_MISCONCEPTION_TTL_SECONDS", str(30 * 24 * 3600)))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("TUTOR_MISCONCEPTION_MAX_ENTRIES", "5000"))
+
+        self._db: Optional[sqlite3.Connection] = None
+        # Calls arrive from worker threads; the connection is used by one at a time
+        self._lock = threading.RLock()
+        self._inserts_since_prune = 0
+        if self.enabled:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS misconceptions ("
+                "key TEXT PRIMARY KEY, question TEXT, answer TEXT, diagnosis TEXT, "
+                "created_at REAL, last_used REAL, hits INTEGER DEFAULT 0)"
+            )
+            self._db.commit()
+
+        self.hits = 0
+        self.misses = 0
+        # Key -> (last used, hits) not yet written to the database
+        self._pending_hits: Dict[str, Tuple[float, int]] = {}
+
+    @staticmethod
+    def make_key(question: str, answer: str) -> str:
+        """Build the key from the normalized question and normalized wrong answer."""
+        raw = f"{normalize_message(question)}\x1f{normalize_message(answer)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def key_for_history(self, history: List[ChatMessageContent]) -> Optional[str]:
+        """Return the key for the latest student message in `history`, if it holds an answer."""
+        if self._db is None:
+            return None
+        for message in reversed(history):
+            if message.role == AuthorRole.USER:
+                pair = split_question_answer(message.content or "")
+                return self.make_key(*pair) if pair else None
+        return None
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the stored diagnosis for `key`, or None if missing or expired."""
+        if self._db is None:
+            return None
+
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT diagnosis FROM misconceptions WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            # A lookup stays a read: the hit is written later, together with other hits
+            _, pending = self._pending_hits.get(key, (now, 0))
+            self._pending_hits[key] = (now, pending + 1)
+            if len(self._pending_hits) >= HIT_FLUSH_THRESHOLD:
+                self.flush_hits()
+            self.hits += 1
+            return row["diagnosis"]
+
+    def flush_hits(self):
+        """Write the pending hit counts and last-used times to the database."""
+        if self._db is None:
+            return
+        with self._lock:
+            if self._pending_hits:
+                self._write_hits()
+                self._db.commit()
+
+    def _write_hits(self):
+        pending, self._pending_hits = self._pending_hits, {}
+        self._db.executemany(
+            "UPDATE misconceptions SET last_used = MAX(last_used, ?), hits = hits + ? WHERE key = ?",
+            [(last_used, hits, key) for key, (last_used, hits) in pending.items()],
+        )
+
+    def set(self, key: str, question: str, answer: str, diagnosis: str):
+        """Store a diagnosis; every PRUNE_INTERVAL diagnoses, expired and least recently used entries are pruned."""
+        if self._db is None or not diagnosis.strip():
+            return
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO misconceptions (key, question, answer, diagnosis, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, question, answer, diagnosis, now, now),
+            )
+            self._inserts_since_prune += 1
+            if self._inserts_since_prune >= PRUNE_INTERVAL:
+                self._prune(now)
+            self._db.commit()
+
+    def _prune(self, now: float):
+        # Pending hits first, so the least recently used entries are pruned
+        self._write_hits()
+        self._db.execute("DELETE FROM misconceptions WHERE created_at < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM misconceptions WHERE key NOT IN "
+            "(SELECT key FROM misconceptions ORDER BY last_used DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        self._inserts_since_prune = 0
+
+    def list_entries(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Return stored diagnoses, most recently used first."""
+        if self._db is None:
+            return []
+        self.flush_hits()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, question, answer, diagnosis, created_at, last_used, hits FROM misconceptions "
+                "ORDER BY last_used DESC LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def purge(self, key: Optional[str] = None, older_than: Optional[float] = None) -> int:
+        """
+        Delete diagnoses.
+
+        Args:
+            key: Delete only this entry
+            older_than: Delete only entries created more than this many seconds ago
+
+        Returns:
+            The number of entries deleted
+        """
+        if self._db is None:
+            return 0
+        with self._lock:
+            self._write_hits()
+            if key is not None:
+                cursor = self._db.execute("DELETE FROM misconceptions WHERE key = ?", (key,))
+            elif older_than is not None:
+                cursor = self._db.execute("DELETE FROM misconceptions WHERE created_at < ?", (time.time() - older_than,))
+            else:
+                cursor = self._db.execute("DELETE FROM misconceptions")
+            self._db.commit()
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the number of stored diagnoses."""
+        entries = 0
+        if self._db is not None:
+            with self._lock:
+                entries = self._db.execute("SELECT COUNT(*) FROM misconceptions").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class MisconceptionCachingAgent(RoutedChatCompletionAgent):
+    """
+    A RoutedChatCompletionAgent that answers from the MisconceptionStore when the
+    student's (question, wrong answer) has already been diagnosed, and stores
+    new diagnoses after a streamed invocation.
+    """
+
+    misconception_store: Optional[MisconceptionStore] = Field(default=None, exclude=True)
+
+    def __init__(self, *, misconception_store: Optional[MisconceptionStore] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.misconception_store = misconception_store
+
+    async def invoke_stream(
+        self,
+        history: ChatHistory,
+        arguments: Any = None,
+        kernel: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterable[StreamingChatMessageContent]:
+        """Stream a diagnosis, reusing a stored one for a known (question, wrong answer)."""
+        store = self.misconception_store
+        key = store.key_for_history(history.messages) if store else None
+
+        if key is not None:
+            diagnosis = await asyncio.to_thread(store.get, key)
+            if diagnosis is not None:
+                yield StreamingChatMessageContent(
+                    role=AuthorRole.ASSISTANT, content=diagnosis, choice_index=0, name=self.name
+                )
+                history.add_message(ChatMessageContent(role=AuthorRole.ASSISTANT, content=diagnosis, name=self.name))
+                return
+
+        parts = []
+        async for response in super().invoke_stream(history, arguments, kernel, **kwargs):
+            parts.append(response.content or "")
+            yield response
+
+        if key is not None:
+            question, answer = self._question_answer(history.messages)
+            write = partial(store.set, key, question, answer, "".join(parts))
+            deferred = deferred_diagnoses.get()
+            if deferred is not None:
+                deferred.append(write)
+            else:
+                await asyncio.to_thread(write)
+
+    @staticmethod
+    def _question_answer(history: List[ChatMessageContent]):
+        for message in reversed(history):
+            if message.role == AuthorRole.USER:
+                return split_question_answer(message.content or "") or ("", "")
+        return "", ""
@@ -0,0 +1,237 @@
+import os
+import re
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+from typing import Any, AsyncIterable, Deque, Dict, Iterable, Optional
+
+from pydantic import Field
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings
+from semantic_kernel.contents import ChatHistory, StreamingChatMessageContent
+from semantic_kernel.functions import KernelArguments
+
+from history_reducer import ReducingChatCompletionAgent
+from math_verifier import VERIFIED_CORRECT_MARKER, VERIFIED_INCORRECT_MARKER, split_question_answer, strip_math_note
+
+# Turn classes, from cheapest to most demanding
+TIER_NAMES = ("greeting", "factual", "grading", "deep")
+
+# Default (Tutor service, Reasoning service, latency budget in ms) per tier; services that
+# are not registered fall back to the agent's own service
+DEFAULT_TIERS = {
+    "greeting": ("gpt4o", "o3-mini", 3000),
+    "factual": ("gpt4o", "o3-mini", 8000),
+    "grading": ("gpt4o", "o3-mini", 20000),
+    "deep": ("gpt4o", "o1-model", 60000),
+}
+
+# Latencies kept per tier for the percentiles in the report
+LATENCY_SAMPLES = 500
+
+_GREETING_PATTERN = re.compile(
+    r"^(hi|hello|hey|hiya|good (morning|afternoon|evening)|thanks|thank you|thx|bye|goodbye|see you|ok|okay|cool|great)\b",
+    re.IGNORECASE,
+)
+_CONFUSION_PATTERN = re.compile(
+    r"(don'?t understand|do not understand|didn'?t understand|confused|confusing|doesn'?t make sense|"
+    r"still (wrong|stuck|don'?t)|why (is|was|does|did|do|isn'?t|wasn'?t)|what did i do wrong|where did i go wrong|"
+    r"i('m| am) stuck|mistake)",
+    re.IGNORECASE,
+)
+
+# Process-wide routing counters and recent latencies, per tier
+routing_stats: Counter = Counter()
+_latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+
+
+class ModelTier:
+    """The models a class of turn is sent to, and how long such a turn should take."""
+
+    def __init__(
+        self,
+        name: str,
+        tutor_service: str,
+        reasoning_service: str,
+        latency_budget_ms: float,
+        reasoning_effort: Optional[str] = None,
+    ):
+        self.name = name
+        self.tutor_service = tutor_service
+        self.reasoning_service = reasoning_service
+        self.latency_budget_ms = latency_budget_ms
+        # "low", "medium" or "high" for reasoning models; None leaves the model's default
+        self.reasoning_effort = reasoning_effort
+
+    def service_for(self, role: str) -> str:
+        return self.reasoning_service if role == "reasoning" else self.tutor_service
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "tutor_service": self.tutor_service,
+            "reasoning_service": self.reasoning_service,
+            "reasoning_effort": self.reasoning_effort,
+            "latency_budget_ms": self.latency_budget_ms,
+        }
+
+
+class ModelRouter:
+    """
+    Classifies each incoming turn and picks the model tier that serves it.
+
+    Classification is local (no model call): short pleasantries are greetings,
+    turns the local math check found incorrect or where the student is
+    confused need a deep misconception analysis, other turns containing an
+    answer are graded, and everything else is factual recall. The tier decides
+    which registered service each agent uses for that turn.
+    """
+
+    def __init__(self, services: Iterable[str], enabled: Optional[bool] = None):
+        """
+        Initialize the ModelRouter.
+
+        Args:
+            services: Service ids registered on the kernel
+            enabled: Whether turns are routed by tier
+                (defaults to TUTOR_MODEL_ROUTING or true); when off every agent
+                uses its own service
+
+        Each tier reads TUTOR_TIER_<TIER>_TUTOR, TUTOR_TIER_<TIER>_REASONING,
+        TUTOR_TIER_<TIER>_BUDGET_MS and TUTOR_TIER_<TIER>_REASONING_EFFORT.
+        """
+        self.enabled = enabled if enabled is not None else os.getenv("TUTOR_MODEL_ROUTING", "true").lower() == "true"
+        self.services = set(services)
+        self.tiers: Dict[str, ModelTier] = {}
+        for name in TIER_NAMES:
+            tutor_service, reasoning_service, budget_ms = DEFAULT_TIERS[name]
+            prefix = f"TUTOR_TIER_{name.upper()}"
+            reasoning_service = os.getenv(f"{prefix}_REASONING", reasoning_service)
+            if reasoning_service not in self.services:
+                # The optional o3-mini deployment is not configured
+                reasoning_service = "o1-model"
+            self.tiers[name] = ModelTier(
+                name=name,
+                tutor_service=os.getenv(f"{prefix}_TUTOR", tutor_service),
+                reasoning_service=reasoning_service,
+                latency_budget_ms=float(os.getenv(f"{prefix}_BUDGET_MS", str(budget_ms))),
+                reasoning_effort=os.getenv(f"{prefix}_REASONING_EFFORT") or None,
+            )
+
+    @property
+    def signature(self) -> str:
+        """Text identifying the routing configuration, for cache keys."""
+        if not self.enabled:
+            return "routing:off"
+        return ";".join(
+            f"{tier.name}={tier.tutor_service},{tier.reasoning_service},{tier.reasoning_effort}"
+            for tier in self.tiers.values()
+        )
+
+    @staticmethod
+    def classify(message: str) -> str:
+        """Return the tier name for a student's (possibly math-annotated) message."""
+        text = strip_math_note(message).strip()
+        if VERIFIED_INCORRECT_MARKER in message or _CONFUSION_PATTERN.search(text):
+            return "deep"
+        if VERIFIED_CORRECT_MARKER in message or split_question_answer(text):
+            return "grading"
+        if len(text.split()) <= 6 and _GREETING_PATTERN.match(text) and "?" not in text:
+            return "greeting"
+        return "factual"
+
+    def route(self, message: str) -> Optional[ModelTier]:
+        """Pick the tier for a turn, or None when routing is off."""
+        if not self.enabled:
+            return None
+        tier = self.tiers[self.classify(message)]
+        routing_stats[f"{tier.name}_turns"] += 1
+        return tier
+
+    def record(self, tier: ModelTier, elapsed_ms: float):
+        """Record how long a routed turn took against its tier's budget."""
+        _latencies[tier.name].append(elapsed_ms)
+        routing_stats[f"{tier.name}_completed"] += 1
+        routing_stats[f"{tier.name}_total_ms"] += int(elapsed_ms)
+        if elapsed_ms > tier.latency_budget_ms:
+            routing_stats[f"{tier.name}_over_budget"] += 1
+
+    def settings_for(self, role: str, default_service: str, tier: Optional[ModelTier]) -> OpenAIChatPromptExecutionSettings:
+        """Execution settings selecting the service an agent with `role` uses under `tier`."""
+        if tier is None:
+            return OpenAIChatPromptExecutionSettings(service_id=default_service)
+        service_id = tier.service_for(role)
+        if service_id not in self.services:
+            service_id = default_service
+        settings = OpenAIChatPromptExecutionSettings(service_id=service_id)
+        if role == "reasoning" and tier.reasoning_effort:
+            settings.reasoning_effort = tier.reasoning_effort
+        return settings
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the routing mix, with latency against budget per tier."""
+        routed = sum(routing_stats[f"{name}_turns"] for name in TIER_NAMES)
+        tiers = {}
+        for name, tier in self.tiers.items():
+            completed = routing_stats[f"{name}_completed"]
+            samples = sorted(_latencies[name])
+            tiers[name] = {
+                **tier.describe(),
+                "turns": routing_stats[f"{name}_turns"],
+                "share": routing_stats[f"{name}_turns"] / routed if routed else 0.0,
+                "completed": completed,
+                "average_ms": routing_stats[f"{name}_total_ms"] / completed if completed else 0.0,
+                "p95_ms": samples[int(0.95 * (len(samples) - 1))] if samples else 0.0,
+                "over_budget": routing_stats[f"{name}_over_budget"],
+            }
+        return {"enabled": self.enabled, "routed_turns": routed, "tiers": tiers}
+
+
+# The tier chosen for the turn running in the current task
+active_tier: ContextVar[Optional[ModelTier]] = ContextVar("active_tier", default=None)
+
+
+class RoutedChatCompletionAgent(ReducingChatCompletionAgent):
+    """
+    A ReducingChatCompletionAgent bound to a kernel service, which the running
+    turn's model tier can override.
+
+    Without explicit settings a ChatCompletionAgent uses the first service
+    registered on the kernel, so every agent ran on the same model. The
+    service is passed with each invocation instead of through the agent's
+    arguments because agents are shared across sessions, and the kernel merges
+    invocation settings into the agent's own in place.
+    """
+
+    service_id: str = Field(default="gpt4o")
+    tier_role: str = Field(default="tutor")
+    router: Optional[ModelRouter] = Field(default=None, exclude=True)
+
+    def __init__(
+        self,
+        *,
+        service_id: str = "gpt4o",
+        tier_role: str = "tutor",
+        router: Optional[ModelRouter] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.service_id = service_id
+        self.tier_role = tier_role
+        self.router = router
+
+    async def invoke_stream(
+        self,
+        history: ChatHistory,
+        arguments: Any = None,
+        kernel: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterable[StreamingChatMessageContent]:
+        """Stream a response from the service chosen for this agent and turn."""
+        tier = active_tier.get()
+        if self.router is not None:
+            settings = self.router.settings_for(self.tier_role, self.service_id, tier)
+        else:
+            settings = OpenAIChatPromptExecutionSettings(service_id=self.service_id)
+        routed_arguments = KernelArguments(settings=settings, **(arguments or {}))
+
+        async for response in super().invoke_stream(history, routed_arguments, kernel, **kwargs):
+            yield response
+
@@ -0,0 +1,94 @@
+import os
+from collections import Counter, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from semantic_kernel.contents import ChatMessageContent
+from semantic_kernel.filters import FunctionInvocationContext
+
+# Process-wide token counters, keyed by agent or kernel function name
+usage_stats: Dict[str, Counter] = defaultdict(Counter)
+
+# Price of a cached prompt token relative to an uncached one (Azure OpenAI bills cached input at half price)
+CACHED_TOKEN_PRICE_RATIO = float(os.getenv("TUTOR_CACHED_TOKEN_PRICE_RATIO", "0.5"))
+
+
+def usage_from_message(message: Any) -> Optional[Tuple[int, int, int]]:
+    """
+    Return (prompt tokens, cached prompt tokens, completion tokens) reported with a response.
+
+    The OpenAI response attached as `inner_content` is read first because the
+    kernel's own usage metadata does not carry the cached-token count. Streamed
+    responses report usage only on their last chunk; other chunks return None.
+    """
+    usage = getattr(getattr(message, "inner_content", None), "usage", None)
+    if usage is not None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        return (
+            usage.prompt_tokens or 0,
+            (getattr(details, "cached_tokens", None) or 0) if details is not None else 0,
+            usage.completion_tokens or 0,
+        )
+
+    usage = (getattr(message, "metadata", None) or {}).get("usage")
+    if usage is not None:
+        return usage.prompt_tokens or 0, 0, usage.completion_tokens or 0
+    return None
+
+
+def record_usage(source: str, message: Any) -> bool:
+    """Add a response's token usage to `source`'s counters; returns whether it carried usage."""
+    usage = usage_from_message(message)
+    if usage is None:
+        return False
+    prompt_tokens, cached_tokens, completion_tokens = usage
+    stats = usage_stats[source]
+    stats["calls"] += 1
+    stats["prompt_tokens"] += prompt_tokens
+    stats["cached_tokens"] += cached_tokens
+    stats["completion_tokens"] += completion_tokens
+    return True
+
+
+async def record_function_usage(
+    context: FunctionInvocationContext,
+    next: Callable[[FunctionInvocationContext], Awaitable[None]],
+):
+    """Kernel function invocation filter recording the usage of prompt functions (strategies, summaries)."""
+    await next(context)
+    result = context.result
+    value = result.value if result is not None else None
+    if isinstance(value, list) and value and isinstance(value[0], ChatMessageContent):
+        record_usage(context.function.name, value[0])
+
+
+def get_usage_stats(turns: int = 0) -> Dict[str, Any]:
+    """
+    Return prompt, cached and completion tokens per agent and per function.
+
+    Args:
+        turns: Completed chat turns, for the per-turn averages
+    """
+    sources = {}
+    totals: Counter = Counter()
+    for source, stats in sorted(usage_stats.items()):
+        prompt_tokens = stats["prompt_tokens"]
+        sources[source] = {
+            **stats,
+            "cache_hit_ratio": stats["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0,
+        }
+        totals.update(stats)
+
+    prompt_tokens = totals["prompt_tokens"]
+    # Prompt tokens weighted by price, counting cached tokens at their discounted rate
+    effective_prompt_tokens = prompt_tokens - totals["cached_tokens"] * (1 - CACHED_TOKEN_PRICE_RATIO)
+    return {
+        "sources": sources,
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": totals["cached_tokens"],
+        "completion_tokens": totals["completion_tokens"],
+        "cache_hit_ratio": totals["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0,
+        "cached_token_price_ratio": CACHED_TOKEN_PRICE_RATIO,
+        "prompt_tokens_per_turn": prompt_tokens / turns if turns else 0.0,
+        "effective_prompt_tokens_per_turn": effective_prompt_tokens / turns if turns else 0.0,
+        "completion_tokens_per_turn": totals["completion_tokens"] / turns if turns else 0.0,
+    }
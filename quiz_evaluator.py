@@ -0,0 +1,153 @@
+import os
+import time
+import asyncio
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from semantic_kernel import Kernel
+from semantic_kernel.agents import ChatCompletionAgent
+from semantic_kernel.contents import AuthorRole, ChatHistory, ChatMessageContent
+
+from admission import BATCH, call_priority
+
+EVALUATOR_NAME = "QuizEvaluatorTutor"
+
+# Answers graded at once in a batch, by default and at most
+QUIZ_CONCURRENCY = int(os.getenv("TUTOR_QUIZ_CONCURRENCY", "8"))
+
+INSTRUCTIONS = """
+You are an expert quiz evaluator and tutor. Your task is to evaluate a student's answer against
+a ground truth answer for a given quiz question.
+
+Follow these steps in your evaluation:
+
+1. Compare the student's answer with the ground truth answer for factual and conceptual accuracy.
+2. Determine if the student's answer is correct, partially correct, or incorrect.
+3. If the answer is incorrect or partially correct, identify specifically what concepts the student likely misunderstood.
+4. Provide a detailed explanation of the misunderstanding and the correct understanding.
+5. Use specific evidence from the student's answer to support your analysis.
+
+Your response should be structured as follows:
+- Evaluation: [Correct/Partially Correct/Incorrect]
+- Analysis: [Brief analysis of the student's answer]
+- Misunderstandings: [If applicable, what concepts were misunderstood]
+- Explanation: [Clear explanation of the correct concepts]
+
+Be precise, educational, and supportive in your feedback.
+"""
+
+
+class QuizEvaluator:
+    """
+    Grades (question, ground_truth, student_answer) triples with the quiz evaluator agent,
+    one at a time or as a whole class's batch.
+    """
+
+    def __init__(self, kernel: Kernel, max_concurrency: Optional[int] = None):
+        """
+        Initialize the QuizEvaluator.
+
+        Args:
+            kernel: Kernel with the chat completion service used for grading
+            max_concurrency: Default number of answers graded at once in a batch
+                (defaults to TUTOR_QUIZ_CONCURRENCY or 8)
+        """
+        self.agent = ChatCompletionAgent(
+            kernel=kernel,
+            name=EVALUATOR_NAME,
+            instructions=INSTRUCTIONS,
+        )
+        self.max_concurrency = max_concurrency if max_concurrency is not None else QUIZ_CONCURRENCY
+
+    @staticmethod
+    def _build_history(question: str, ground_truth: str, student_answer: str) -> ChatHistory:
+        """Create a new chat history holding the evaluation prompt."""
+        history = ChatHistory()
+
+        # Format the prompt with all the necessary information
+        prompt = f"""Please evaluate the following quiz response:
+
+    Question: {question}
+
+    Ground Truth Answer: {ground_truth}
+
+    Student Answer: {student_answer}
+    """
+
+        history.add_message(ChatMessageContent(role=AuthorRole.USER, content=prompt))
+        return history
+
+    async def evaluate_answer(self, question: str, ground_truth: str, student_answer: str) -> str:
+        """Evaluate a student's quiz answer against the ground truth.
+
+        Args:
+            question: The quiz question
+            ground_truth: The correct answer
+            student_answer: The student's submitted answer
+
+        Returns:
+            The agent's evaluation and feedback
+        """
+        history = self._build_history(question, ground_truth, student_answer)
+        response = await self.agent.get_response(history=history)
+        return response.content
+
+    async def evaluate_answer_streaming(
+        self, question: str, ground_truth: str, student_answer: str
+    ) -> AsyncGenerator[str, None]:
+        """Evaluate a student's quiz answer against the ground truth, streaming the feedback.
+
+        Args:
+            question: The quiz question
+            ground_truth: The correct answer
+            student_answer: The student's submitted answer
+
+        Yields:
+            Chunks of the agent's evaluation as they arrive
+        """
+        history = self._build_history(question, ground_truth, student_answer)
+        async for response_chunk in self.agent.invoke_stream(history=history):
+            if response_chunk.content:
+                yield response_chunk.content
+
+    async def evaluate_batch(
+        self,
+        submissions: List[Dict[str, Any]],
+        max_concurrency: Optional[int] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Grade a batch of submissions concurrently, yielding each result as it finishes.
+
+        Args:
+            submissions: Dicts with 'question', 'ground_truth', 'student_answer'
+                and an optional 'submission_id'
+            max_concurrency: Number of answers graded at once (defaults to the evaluator's setting)
+
+        Yields:
+            Dict with 'index', 'submission_id', 'evaluation' or 'error', and 'elapsed_ms'
+            for each submission, in completion order
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or self.max_concurrency))
+
+        async def grade(index: int, submission: Dict[str, Any]) -> Dict[str, Any]:
+            # Batch grading yields model capacity to students waiting on chat turns
+            call_priority.set(BATCH)
+            async with semaphore:
+                start = time.perf_counter()
+                result: Dict[str, Any] = {"index": index, "submission_id": submission.get("submission_id")}
+                try:
+                    result["evaluation"] = await self.evaluate_answer(
+                        submission["question"], submission["ground_truth"], submission["student_answer"]
+                    )
+                except Exception as e:
+                    result["error"] = str(e)
+                result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                return result
+
+        tasks = [asyncio.create_task(grade(index, submission)) for index, submission in enumerate(submissions)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            # Stop grading if the caller goes away before the batch is done
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,170 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a user message so trivially different phrasings share a key."""
+    text = unicodedata.normalize("NFKC", message).casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!.… ")
+
+
+def compact_chunks(chunks: Iterable[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Collapse a streamed turn into one agent marker and one content chunk per agent.
+
+    The result replays through the same SSE framing as the original stream.
+    """
+    segments: List[Tuple[str, List[str]]] = []
+    for chunk in chunks:
+        agent = chunk.get("agent")
+        if not agent:
+            continue
+        if not segments or segments[-1][0] != agent:
+            segments.append((agent, []))
+        segments[-1][1].append(chunk.get("content") or "")
+
+    compacted: List[Dict[str, str]] = []
+    for agent, parts in segments:
+        compacted.append({"agent": agent, "content": ""})
+        content = "".join(parts)
+        if content:
+            compacted.append({"agent": agent, "content": content})
+    return compacted
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of complete tutor turns.
+
+    Entries live in memory, and optionally in a SQLite file so they survive
+    restarts and can be shared between workers on the same host.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None,
+        path: Optional[str] = None,
+        enabled: Optional[bool] = None,
+    ):
+        """
+        Initialize the ResponseCache.
+
+        Args:
+            max_entries: Maximum number of cached turns
+                (defaults to TUTOR_RESPONSE_CACHE_SIZE or 1000)
+            ttl: Seconds a cached turn stays valid
+                (defaults to TUTOR_RESPONSE_CACHE_TTL_SECONDS or 3600)
+            path: SQLite file for the on-disk backend
+                (defaults to TUTOR_RESPONSE_CACHE_PATH; memory only if unset)
+            enabled: Whether the cache is used at all
+                (defaults to TUTOR_RESPONSE_CACHE or true)
+        """
+        self.enabled = enabled if enabled is not None else os.getenv("TUTOR_RESPONSE_CACHE", "true").lower() == "true"
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("TUTOR_RESPONSE_CACHE_SIZE", "1000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("TUTOR_RESPONSE_CACHE_TTL_SECONDS", "3600"))
+        self.path = path if path is not None else os.getenv("TUTOR_RESPONSE_CACHE_PATH")
+
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict[str, str]]]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        if self.enabled and self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires_at REAL, chunks TEXT)"
+            )
+            self._db.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(message: str, agent_names: Iterable[str], prompt_version: str) -> str:
+        """Build the cache key from the normalized message, the agents and the prompt version."""
+        raw = "\x1f".join([normalize_message(message), ",".join(agent_names), prompt_version])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict[str, str]]]:
+        """Return the cached chunks for `key`, or None on a miss."""
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            row = self._db.execute("SELECT expires_at, chunks FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                entry = (row[0], json.loads(row[1]))
+                self._remember(key, entry)
+
+        if entry is None or entry[0] < now:
+            if entry is not None:
+                self._forget(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, chunks: List[Dict[str, str]]):
+        """Store a completed turn under `key`."""
+        entry = (time.time() + self.ttl, chunks)
+        self._remember(key, entry)
+        self.stores += 1
+
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, expires_at, chunks) VALUES (?, ?, ?)",
+                (key, entry[0], json.dumps(chunks)),
+            )
+            # Keep the file bounded: drop expired rows, then the soonest-to-expire overflow
+            self._db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            self._db.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY expires_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def clear(self):
+        """Drop every cached turn."""
+        self._entries.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def _remember(self, key: str, entry: Tuple[float, List[Dict[str, str]]]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _forget(self, key: str):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and occupancy."""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": "sqlite" if self._db is not None else "memory",
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,246 @@
+import os
+import asyncio
+from collections import Counter
+from importlib.util import find_spec
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+from pydantic import ValidationError
+from semantic_kernel import Kernel
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion, AzureOpenAISettings
+from semantic_kernel.exceptions import ServiceInitializationError
+from semantic_kernel.utils.telemetry.user_agent import APP_INFO, prepend_semantic_kernel_to_user_agent
+
+from admission import LimitedAzureChatCompletion
+from hedging import Endpoint, HedgedAzureChatCompletion
+
+# HTTP/2 multiplexes concurrent streams over one connection; it needs the optional h2 package
+HTTP2_ENABLED = os.getenv("TUTOR_HTTP2", "true").lower() == "true" and find_spec("h2") is not None
+
+# Connections per endpoint, idle connections kept open, and how long they are kept
+MAX_CONNECTIONS = int(os.getenv("TUTOR_HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("TUTOR_HTTP_MAX_KEEPALIVE", "20"))
+KEEPALIVE_SECONDS = float(os.getenv("TUTOR_HTTP_KEEPALIVE_SECONDS", "60"))
+
+# Kernel service id and environment variable suffix of each model
+MODEL_SERVICES = (("gpt4o", "4o"), ("o1-model", "o1"), ("o3-mini", "o3-mini"))
+
+# Additional endpoints per model are read from <VARIABLE>_<suffix>_2 up to _<MAX_ENDPOINTS>
+MAX_ENDPOINTS = 9
+
+
+class ConnectionPool:
+    """A keep-alive HTTP client for one Azure OpenAI endpoint, shared by every deployment on it."""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.stats: Counter = Counter()
+        self._known_connections: Set[int] = set()
+        self.client = DefaultAsyncHttpxClient(
+            http2=HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_SECONDS,
+            ),
+            event_hooks={"request": [self._on_request], "response": [self._on_response]},
+        )
+
+    def _connections(self) -> List[Any]:
+        # httpx does not expose its pool; read it defensively
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        return list(getattr(pool, "connections", None) or [])
+
+    async def _on_request(self, request: httpx.Request):
+        self.stats["requests"] += 1
+
+    async def _on_response(self, response: httpx.Response):
+        self.stats[response.http_version] += 1
+        connections = {id(connection) for connection in self._connections()}
+        self.stats["connections_opened"] += len(connections - self._known_connections)
+        self._known_connections = connections
+
+    def describe(self) -> Dict[str, Any]:
+        connections = self._connections()
+        opened = self.stats["connections_opened"]
+        return {
+            **self.stats,
+            "http2": HTTP2_ENABLED,
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+            "requests_per_connection": self.stats["requests"] / opened if opened else 0.0,
+        }
+
+
+# Process-wide pools by endpoint host, API clients by deployment, and kernel services by id
+pools: Dict[str, ConnectionPool] = {}
+_clients: Dict[Tuple[Optional[str], ...], AsyncAzureOpenAI] = {}
+_services: Dict[str, LimitedAzureChatCompletion] = {}
+
+
+def endpoint_configs(suffix: str) -> List[Dict[str, Optional[str]]]:
+    """
+    Read the endpoints configured for a model, e.g. suffix "4o".
+
+    The first comes from AZURE_OPENAI_ENDPOINT_4o (with _API_KEY_, _DEPLOYMENT_ and
+    _API_VERSION_), further ones from AZURE_OPENAI_ENDPOINT_4o_2 and so on; their
+    key, deployment and API version default to the first endpoint's.
+    """
+    def setting(name: str, tail: str) -> Optional[str]:
+        return os.getenv(f"AZURE_OPENAI_{name}_{tail}")
+
+    base = {
+        "endpoint": setting("ENDPOINT", suffix),
+        "api_key": setting("API_KEY", suffix),
+        "deployment_name": setting("DEPLOYMENT", suffix),
+        "api_version": setting("API_VERSION", suffix),
+    }
+    configs = [base]
+    for index in range(2, MAX_ENDPOINTS + 1):
+        tail = f"{suffix}_{index}"
+        if not setting("ENDPOINT", tail):
+            continue
+        configs.append({key: setting(name, tail) or base[key] for key, name in (
+            ("endpoint", "ENDPOINT"),
+            ("api_key", "API_KEY"),
+            ("deployment_name", "DEPLOYMENT"),
+            ("api_version", "API_VERSION"),
+        )})
+    return configs
+
+
+def _pool_host(endpoint: str) -> str:
+    url = httpx.URL(endpoint)
+    return f"{url.scheme}://{url.netloc.decode()}"
+
+
+def get_connection_pool(endpoint: str) -> ConnectionPool:
+    """Return the process-wide connection pool for an endpoint's host."""
+    host = _pool_host(endpoint)
+    pool = pools.get(host)
+    if pool is None:
+        pool = pools[host] = ConnectionPool(host)
+    return pool
+
+
+def azure_settings(config: Dict[str, Optional[str]]) -> AzureOpenAISettings:
+    """
+    Resolve one deployment's settings.
+
+    Unset values fall back to the unsuffixed AZURE_OPENAI_* variables, as they
+    do for AzureChatCompletion.
+    """
+    try:
+        settings = AzureOpenAISettings.create(
+            api_key=config.get("api_key"),
+            endpoint=config.get("endpoint"),
+            chat_deployment_name=config.get("deployment_name"),
+            api_version=config.get("api_version"),
+        )
+    except ValidationError as exc:
+        raise ServiceInitializationError(f"Failed to validate settings: {exc}") from exc
+    if not settings.endpoint or not settings.chat_deployment_name:
+        raise ServiceInitializationError("An endpoint and a deployment name are required.")
+    return settings
+
+
+def get_openai_client(settings: AzureOpenAISettings) -> AsyncAzureOpenAI:
+    """Return the process-wide API client for one deployment, sending through its endpoint's pool."""
+    api_key = settings.api_key.get_secret_value() if settings.api_key else None
+    key = (str(settings.endpoint), settings.chat_deployment_name, settings.api_version, api_key)
+    client = _clients.get(key)
+    if client is None:
+        # The same headers AzureChatCompletion sends with the clients it creates itself
+        headers: Dict[str, str] = {}
+        if APP_INFO:
+            headers.update(APP_INFO)
+            headers = prepend_semantic_kernel_to_user_agent(headers)
+        client = _clients[key] = AsyncAzureOpenAI(
+            azure_endpoint=str(settings.endpoint),
+            azure_deployment=settings.chat_deployment_name,
+            api_key=api_key,
+            api_version=settings.api_version,
+            default_headers=headers,
+            http_client=get_connection_pool(str(settings.endpoint)).client,
+        )
+    return client
+
+
+def _create_service(service_id: str, settings: AzureOpenAISettings, service_class: type = AzureChatCompletion):
+    return service_class(
+        service_id=service_id,
+        deployment_name=settings.chat_deployment_name,
+        async_client=get_openai_client(settings),
+    )
+
+
+def get_chat_service(service_id: str, suffix: str) -> LimitedAzureChatCompletion:
+    """
+    Return the process-wide kernel service for a model, from its AZURE_OPENAI_*_<suffix> settings.
+
+    With a single endpoint this is an admission-controlled service; with
+    several it hedges and fails over between them. Every kernel gets the same
+    instance, so admission, latency and circuit state are shared.
+    """
+    service = _services.get(service_id)
+    if service is not None:
+        return service
+
+    deployments = [azure_settings(config) for config in endpoint_configs(suffix)]
+    if len(deployments) == 1:
+        service = _create_service(service_id, deployments[0], LimitedAzureChatCompletion)
+    else:
+        service = HedgedAzureChatCompletion(service_id=service_id, endpoints=[
+            Endpoint(str(settings.endpoint), _create_service(service_id, settings)) for settings in deployments
+        ])
+    _services[service_id] = service
+    return service
+
+
+def create_kernel() -> Kernel:
+    """
+    Create a kernel with the tutor's model services: gpt4o, o1-model and, when
+    AZURE_OPENAI_DEPLOYMENT_o3-mini and AZURE_OPENAI_ENDPOINT_o3-mini are set, o3-mini.
+    """
+    kernel = Kernel()
+    for service_id, suffix in MODEL_SERVICES:
+        if service_id == "o3-mini" and not (
+            os.getenv("AZURE_OPENAI_DEPLOYMENT_o3-mini") and os.getenv("AZURE_OPENAI_ENDPOINT_o3-mini")
+        ):
+            continue
+        kernel.add_service(get_chat_service(service_id, suffix))
+    return kernel
+
+
+async def warm_up_connections(timeout: float = 10.0):
+    """
+    Open a connection to each endpoint so the first chat skips the TCP/TLS handshake.
+
+    Failures are ignored: warm-up only saves latency, it does not validate configuration.
+    """
+    clients_by_pool: Dict[str, AsyncAzureOpenAI] = {}
+    for (endpoint, *_), client in _clients.items():
+        clients_by_pool.setdefault(_pool_host(endpoint), client)
+
+    async def touch(client: AsyncAzureOpenAI):
+        try:
+            await asyncio.wait_for(client.models.list(), timeout=timeout)
+        except Exception:
+            pass
+
+    await asyncio.gather(*(touch(client) for client in clients_by_pool.values()))
+
+
+async def close_connection_pools():
+    """Close every pooled connection, e.g. at shutdown; later services get new pools."""
+    for pool in pools.values():
+        await pool.client.aclose()
+    pools.clear()
+    _clients.clear()
+    _services.clear()
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Return requests, connections opened and connection reuse per endpoint."""
+    return {host: pool.describe() for host, pool in sorted(pools.items())}
@@ -0,0 +1,143 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class SessionPoolFullError(Exception):
+    """Raised when every pooled session is busy and the pool is at capacity."""
+
+
+class ChatSession:
+    """
+    A single conversation held by the SessionPool.
+
+    The lock serializes turns within the session, since an AgentGroupChat
+    cannot run two invocations at once. Different sessions run concurrently.
+    """
+
+    def __init__(self, session_id: str, manager: Any):
+        self.session_id = session_id
+        self.manager = manager
+        self.lock = asyncio.Lock()
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+    @property
+    def busy(self) -> bool:
+        """Whether a turn is currently running in this session."""
+        return self.lock.locked()
+
+    def touch(self):
+        """Mark the session as recently used."""
+        self.last_used = time.monotonic()
+
+
+class SessionPool:
+    """
+    A bounded, session-keyed pool of agent chats.
+
+    Sessions are created lazily on first use and evicted when they have been
+    idle for longer than `idle_ttl` seconds, or in least-recently-used order
+    once more than `max_sessions` are held. Busy sessions are never evicted.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        max_sessions: Optional[int] = None,
+        idle_ttl: Optional[float] = None,
+    ):
+        """
+        Initialize the SessionPool.
+
+        Args:
+            factory: Callable that builds the manager for a new session
+            max_sessions: Maximum number of sessions held at once
+                (defaults to TUTOR_MAX_SESSIONS or 200)
+            idle_ttl: Seconds a session may sit idle before it is evicted
+                (defaults to TUTOR_SESSION_TTL_SECONDS or 1800)
+        """
+        self._factory = factory
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("TUTOR_MAX_SESSIONS", "200"))
+        self.idle_ttl = idle_ttl if idle_ttl is not None else float(os.getenv("TUTOR_SESSION_TTL_SECONDS", "1800"))
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> ChatSession:
+        """
+        Return the session for `session_id`, creating it if needed.
+
+        Raises:
+            SessionPoolFullError: If a new session is needed but every held
+                session is busy and the pool is at capacity
+        """
+        self._evict_idle()
+
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self.touch(session)
+            return session
+
+        if len(self._sessions) >= self.max_sessions and not self._evict_lru():
+            raise SessionPoolFullError(
+                f"All {self.max_sessions} tutor sessions are busy, please retry shortly"
+            )
+
+        session = ChatSession(session_id, self._factory())
+        self._sessions[session_id] = session
+        self.created += 1
+        return session
+
+    def touch(self, session: ChatSession):
+        """Mark a session as recently used, keeping the pool in least-recently-used order."""
+        session.touch()
+        if self._sessions.get(session.session_id) is session:
+            self._sessions.move_to_end(session.session_id)
+
+    def peek(self, session_id: str) -> Optional[ChatSession]:
+        """Return the session for `session_id` without creating or touching it."""
+        return self._sessions.get(session_id)
+
+    def discard(self, session_id: str) -> bool:
+        """Drop a session from the pool. Returns True if it existed."""
+        return self._sessions.pop(session_id, None) is not None
+
+    def _evict_idle(self):
+        """Evict sessions that have been idle for longer than the TTL."""
+        if self.idle_ttl <= 0:
+            return
+
+        cutoff = time.monotonic() - self.idle_ttl
+        # Sessions are kept in LRU order, so stop at the first recent one
+        for session_id, session in list(self._sessions.items()):
+            if session.last_used > cutoff:
+                break
+            if not session.busy:
+                del self._sessions[session_id]
+                self.evicted += 1
+
+    def _evict_lru(self) -> bool:
+        """Evict the least recently used idle session. Returns True on success."""
+        for session_id, session in self._sessions.items():
+            if not session.busy:
+                del self._sessions[session_id]
+                self.evicted += 1
+                return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool occupancy and eviction counters."""
+        return {
+            "sessions": len(self._sessions),
+            "busy": sum(1 for session in self._sessions.values() if session.busy),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "created": self.created,
+            "evicted": self.evicted,
+        }
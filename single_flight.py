@@ -0,0 +1,192 @@
+import time
+import asyncio
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+
+class FlightCancelled(Exception):
+    """The generation was cancelled because every subscriber went away."""
+
+
+class Flight:
+    """
+    One upstream generation shared by every request that joined it.
+
+    Chunks are buffered for the lifetime of the flight so subscribers that
+    join late replay what they missed before following the live stream.
+    The generation is cancelled once its last subscriber leaves early and
+    nobody subscribes again within `abandon_grace` seconds.
+    """
+
+    def __init__(self, key: str, abandon_grace: float = 0.0, owner: Optional[str] = None):
+        self.key = key
+        # The session whose chat the generation runs in, if any
+        self.owner = owner
+        self.chunks: List[Dict[str, Any]] = []
+        self.size = 0
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.abandon_grace = abandon_grace
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+        self._updated = asyncio.Event()
+
+    def start(
+        self,
+        producer: Callable[[], AsyncIterator[Dict[str, Any]]],
+        on_done: Optional[Callable[["Flight"], None]] = None,
+    ):
+        """Run `producer` in a background task, publishing its chunks."""
+        self.task = asyncio.create_task(self._run(producer, on_done))
+
+    async def _run(
+        self,
+        producer: Callable[[], AsyncIterator[Dict[str, Any]]],
+        on_done: Optional[Callable[["Flight"], None]],
+    ):
+        error = None
+        try:
+            async for chunk in producer():
+                self.publish(chunk)
+        except asyncio.CancelledError:
+            error = FlightCancelled("Generation cancelled: no subscribers left")
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            if on_done is not None:
+                on_done(self)
+            self.finish(error)
+
+    def cancel(self):
+        """Stop the upstream generation if it is still running."""
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    def publish(self, chunk: Dict[str, Any]):
+        """Append a chunk and wake every waiting subscriber."""
+        self.chunks.append(chunk)
+        self.size += len(chunk.get("content") or "")
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        """Mark the flight complete, optionally with the error that ended it."""
+        self.done = True
+        self.finished_at = time.monotonic()
+        self.error = error
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+        self._notify()
+
+    def _notify(self):
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    def _cancel_if_abandoned(self):
+        self._abandon_timer = None
+        if self.subscribers == 0:
+            self.cancel()
+
+    async def subscribe(
+        self, disconnected: Optional[asyncio.Future] = None, start: int = 0, resumable: bool = True
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Stream the flight's chunks, from the beginning or from index `start`.
+
+        Args:
+            disconnected: Future resolved when this subscriber's client goes away;
+                the stream then ends early
+            start: Index of the first chunk to send, e.g. when a client resumes
+            resumable: Whether the client may come back for the rest; if not, the
+                generation is cancelled without a grace period when it leaves last
+
+        Raises:
+            Exception: The error that ended the upstream generation, if any
+        """
+        left = False
+
+        def leave(_: asyncio.Future):
+            nonlocal left
+            left = True
+            self._notify()
+
+        if disconnected is not None:
+            disconnected.add_done_callback(leave)
+
+        self.subscribers += 1
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+        try:
+            index = start
+            while not left:
+                if index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                    continue
+                if self.done:
+                    break
+                await self._updated.wait()
+
+            if not left and self.error is not None:
+                raise self.error
+        finally:
+            if disconnected is not None:
+                disconnected.remove_done_callback(leave)
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                if resumable and self.abandon_grace > 0:
+                    # Give a dropped client the chance to reconnect before giving up on the work
+                    self._abandon_timer = asyncio.get_running_loop().call_later(
+                        self.abandon_grace, self._cancel_if_abandoned
+                    )
+                else:
+                    self.cancel()
+
+
+class SingleFlight:
+    """
+    Deduplicates identical in-flight generations.
+
+    The first request for a key starts the producer in a background task;
+    requests for the same key that arrive while it is running subscribe to
+    the same flight instead of starting their own.
+    """
+
+    def __init__(self, abandon_grace: float = 0.0):
+        self.abandon_grace = abandon_grace
+        self._flights: Dict[str, Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def join(
+        self, key: str, producer: Callable[[], AsyncIterator[Dict[str, Any]]], owner: Optional[str] = None
+    ) -> Tuple[Flight, bool]:
+        """
+        Join the running flight for `key`, or start one with `producer` on behalf of `owner`.
+
+        Returns:
+            The flight, and True if this call started it
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.followers += 1
+            return flight, False
+
+        flight = Flight(key, self.abandon_grace, owner)
+        self._flights[key] = flight
+        # New requests after the flight ends start a fresh one (or hit the response cache)
+        flight.start(producer, on_done=lambda done: self._flights.pop(done.key, None))
+        self.leaders += 1
+        return flight, True
+
+    def stats(self) -> Dict[str, Any]:
+        """Return deduplication counters."""
+        requests = self.leaders + self.followers
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "deduplicated_ratio": self.followers / requests if requests else 0.0,
+        }
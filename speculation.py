@@ -0,0 +1,139 @@
+import os
+import time
+import asyncio
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, AsyncIterable, Callable, Dict, List, Optional, Tuple
+
+from semantic_kernel.contents import ChatHistory, ChatMessageContent, StreamingChatMessageContent
+
+from math_verifier import VERIFIED_CORRECT_MARKER
+from misconception_store import MisconceptionCachingAgent, deferred_diagnoses
+
+# Start the Reasoning analysis alongside the Tutor's first reply on turns that look like answers
+SPECULATIVE_REASONING = os.getenv("TUTOR_SPECULATIVE_REASONING", "false").lower() == "true"
+
+# Turn classes (see ModelRouter.classify) worth speculating on
+SPECULATIVE_TIERS = ("grading", "deep")
+
+# Process-wide speculation counters
+speculation_stats: Counter = Counter()
+
+
+def should_speculate(message: str, tier_name: str) -> bool:
+    """
+    Whether a turn's student message is worth a speculative Reasoning analysis.
+
+    Only answers to grade qualify, and only when the local checks cannot
+    already settle the turn: an answer the math check verified as correct
+    ends the turn without a hand-off (see HeuristicTerminationStrategy), so
+    an analysis started for it would always be wasted.
+    """
+    if VERIFIED_CORRECT_MARKER in message:
+        speculation_stats["skipped_verified_correct"] += 1
+        return False
+    return tier_name in SPECULATIVE_TIERS
+
+
+class Speculation:
+    """
+    A Reasoning analysis started before the Tutor asks for it.
+
+    The analysis runs on the conversation as it stood when the student's
+    message arrived, so it does not see the Tutor's hand-off message; the
+    Reasoning prompt analyzes the student's answer either way. Its diagnosis
+    is only written to the misconception store once the Tutor hands off.
+    """
+
+    def __init__(self, agent: "SpeculativeReasoningAgent", history: ChatHistory):
+        self.agent = agent
+        self.started = time.perf_counter()
+        self.claimed = False
+        # Misconception store writes held back until the analysis is claimed
+        self.deferred_writes: List[Callable[[], None]] = []
+        speculation_stats["started"] += 1
+        self.task = asyncio.ensure_future(self._run(ChatHistory(messages=list(history.messages))))
+
+    async def _run(self, history: ChatHistory) -> Tuple[List[StreamingChatMessageContent], List[ChatMessageContent]]:
+        # This task has its own copy of the context: invoke the agent for real, not from the speculation
+        active_speculation.set(None)
+        deferred_diagnoses.set(self.deferred_writes)
+        start = len(history.messages)
+        chunks = [chunk async for chunk in self.agent.invoke_stream(history)]
+        return chunks, history.messages[start:]
+
+    async def claim(self) -> Optional[Tuple[List[StreamingChatMessageContent], List[ChatMessageContent]]]:
+        """Take the analysis for the Reasoning agent's turn; None if it failed and must be run live."""
+        self.claimed = True
+        ready = self.task.done()
+        wait_start = time.perf_counter()
+        try:
+            result = await self.task
+        except Exception:
+            speculation_stats["failed"] += 1
+            return None
+        for write in self.deferred_writes:
+            await asyncio.to_thread(write)
+        speculation_stats["hits"] += 1
+        speculation_stats["ready_on_hand_off"] += int(ready)
+        speculation_stats["wait_ms"] += int((time.perf_counter() - wait_start) * 1000)
+        return result
+
+    def finish(self):
+        """End of the turn: drop the analysis if the Tutor never handed off."""
+        if self.claimed:
+            return
+        speculation_stats["dropped"] += 1
+        if not self.task.done():
+            speculation_stats["cancelled"] += 1
+            self.task.cancel()
+        elif not self.task.cancelled() and self.task.exception() is not None:
+            speculation_stats["failed"] += 1
+
+
+# The speculation for the turn running in the current task
+active_speculation: ContextVar[Optional[Speculation]] = ContextVar("active_speculation", default=None)
+
+
+class SpeculativeReasoningAgent(MisconceptionCachingAgent):
+    """
+    A MisconceptionCachingAgent that, when invoked during a turn with a
+    speculation running, answers with that speculation's analysis instead of
+    starting a new one.
+    """
+
+    async def invoke_stream(
+        self,
+        history: ChatHistory,
+        arguments: Any = None,
+        kernel: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterable[StreamingChatMessageContent]:
+        """Stream the speculative analysis if one is running for this turn, else a live one."""
+        speculation = active_speculation.get()
+        result = None
+        if speculation is not None and speculation.agent is self and not speculation.claimed:
+            result = await speculation.claim()
+
+        if result is None:
+            async for response in super().invoke_stream(history, arguments, kernel, **kwargs):
+                yield response
+            return
+
+        chunks, messages = result
+        for chunk in chunks:
+            yield chunk
+        for message in messages:
+            history.add_message(message)
+
+
+def get_speculation_stats() -> Dict[str, Any]:
+    """Return how often speculative Reasoning analyses were used, and how long hand-offs waited for them."""
+    started = speculation_stats["started"]
+    hits = speculation_stats["hits"]
+    return {
+        "enabled": SPECULATIVE_REASONING,
+        **speculation_stats,
+        "hit_rate": hits / started if started else 0.0,
+        "average_wait_ms": speculation_stats["wait_ms"] / hits if hits else 0.0,
+    }
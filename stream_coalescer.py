@@ -0,0 +1,134 @@
+import os
+import asyncio
+from collections import Counter
+from typing import Any, AsyncGenerator, AsyncIterable, Dict, List, Optional
+
+# Process-wide counters for chunks in and frames out of the coalescer
+coalescing_stats: Counter = Counter()
+
+DEFAULT_WINDOW_MS = float(os.getenv("TUTOR_STREAM_COALESCE_MS", "0"))
+DEFAULT_MAX_BYTES = int(os.getenv("TUTOR_STREAM_COALESCE_BYTES", "256"))
+
+
+async def coalesce_chunks(
+    chunks: AsyncIterable[Dict[str, Any]],
+    window_ms: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Merge consecutive content chunks from the same agent so fewer SSE frames are written.
+
+    Buffered content is flushed once it has been held for the window, when it
+    reaches `max_bytes`, and before any agent switch or error. Agent switches and each
+    agent's first token are sent as soon as they arrive so time-to-first-token is unchanged.
+
+    Args:
+        chunks: Chunk dicts as produced by process_chat_message
+        window_ms: Longest time content is held back (defaults to TUTOR_STREAM_COALESCE_MS;
+            0 disables coalescing)
+        max_bytes: Buffered content size that forces a flush
+            (defaults to TUTOR_STREAM_COALESCE_BYTES or 256)
+
+    Yields:
+        The same chunk dicts, with runs of content chunks merged
+    """
+    window = (window_ms if window_ms is not None else DEFAULT_WINDOW_MS) / 1000
+    max_bytes = max_bytes if max_bytes is not None else DEFAULT_MAX_BYTES
+
+    if window <= 0:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    pending: Optional[asyncio.Future] = None
+
+    agent: Optional[str] = None
+    agent_has_content = False
+    buffer: List[str] = []
+    buffer_id: Optional[str] = None
+    size = 0
+    deadline: Optional[float] = None
+
+    def flush() -> Dict[str, Any]:
+        nonlocal buffer, size, deadline
+        chunk = {"agent": agent, "content": "".join(buffer)}
+        if buffer_id is not None:
+            # The merged frame carries the event id of the last chunk it covers
+            chunk["id"] = buffer_id
+        coalescing_stats["frames_out"] += 1
+        buffer, size, deadline = [], 0, None
+        return chunk
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+
+            if deadline is not None:
+                # Wait for the next chunk without cancelling it if the window runs out first
+                done, _ = await asyncio.wait({pending}, timeout=max(0.0, deadline - loop.time()))
+                if not done:
+                    yield flush()
+                    continue
+
+            try:
+                chunk = await pending
+            except StopAsyncIteration:
+                break
+            finally:
+                if pending.done():
+                    pending = None
+
+            coalescing_stats["chunks_in"] += 1
+
+            if "error" in chunk or chunk.get("agent") != agent:
+                if buffer:
+                    yield flush()
+                if "error" in chunk:
+                    coalescing_stats["frames_out"] += 1
+                    yield chunk
+                    continue
+                # Agent switches go out immediately
+                agent = chunk["agent"]
+                agent_has_content = bool(chunk.get("content"))
+                coalescing_stats["frames_out"] += 1
+                yield chunk
+                continue
+
+            content = chunk.get("content") or ""
+            if not content:
+                continue
+            if not agent_has_content:
+                # So does each agent's first token
+                agent_has_content = True
+                coalescing_stats["frames_out"] += 1
+                yield chunk
+                continue
+            buffer.append(content)
+            buffer_id = chunk.get("id")
+            size += len(content.encode("utf-8"))
+            if deadline is None:
+                deadline = loop.time() + window
+            if size >= max_bytes:
+                yield flush()
+
+        if buffer:
+            yield flush()
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+def get_coalescing_stats() -> Dict[str, Any]:
+    """Return how many chunks were merged into how many frames."""
+    chunks_in = coalescing_stats["chunks_in"]
+    frames_out = coalescing_stats["frames_out"]
+    return {
+        "default_window_ms": DEFAULT_WINDOW_MS,
+        "default_max_bytes": DEFAULT_MAX_BYTES,
+        "chunks_in": chunks_in,
+        "frames_out": frames_out,
+        "frames_saved_ratio": 1 - frames_out / chunks_in if chunks_in else 0.0,
+    }
@@ -0,0 +1,42 @@
+import pytest
+
+from math_verifier import VERIFIED_CORRECT_MARKER, VERIFIED_INCORRECT_MARKER, check_math_answer
+
+
+@pytest.mark.parametrize("message", [
+    "What is 1/3? I got 0.33",
+    "What is 2/3? I got 0.67",
+    "What is 7/3? I got 2.33",
+    "What is 7/3? I got 2.3",
+    "Solve 3x = 7, my answer is x = 2.33",
+    "What is 2 + 3? I got 5",
+    "What is 1/4? I got 0.25",
+    "Simplify 2(x + 1), my answer is 2x + 2",
+])
+def test_correct_answers(message):
+    result = check_math_answer(message)
+    assert result is not None and result.is_correct
+    assert result.as_note().startswith(VERIFIED_CORRECT_MARKER)
+
+
+@pytest.mark.parametrize("message", [
+    "What is 1/3? I got 0.34",
+    "What is 2/3? I got 0.66",
+    "What is 7/3? I got 2",
+    "Solve 3x = 7, my answer is x = 2.34",
+    "What is 2 + 3? I got 6",
+    "Simplify 2(x + 1), my answer is 2x + 1",
+])
+def test_incorrect_answers(message):
+    result = check_math_answer(message)
+    assert result is not None and not result.is_correct
+    assert result.as_note().startswith(VERIFIED_INCORRECT_MARKER)
+
+
+@pytest.mark.parametrize("message", [
+    "What is 2 + 2? I got four",
+    "What is 1 + 2? I got 3 dollars",
+    "Solve x^2 = 2, my answer is x = 1.41",
+])
+def test_not_checkable(message):
+    assert check_math_answer(message) is None
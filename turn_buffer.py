@@ -0,0 +1,108 @@
+import os
+import time
+import secrets
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from single_flight import Flight
+
+
+class BufferedTurn:
+    """A streamed turn that a reconnecting client can pick up again."""
+
+    def __init__(self, turn_id: str, session_id: str, message: str, flight: Flight, is_leader: bool):
+        self.turn_id = turn_id
+        self.session_id = session_id
+        self.message = message
+        self.flight = flight
+        # Followers of a shared generation still have to copy the turn into their own chat
+        self.is_leader = is_leader
+        self.recorded = is_leader
+
+    def event_id(self, index: int) -> str:
+        """SSE event id for the chunk at `index`."""
+        return f"{self.turn_id}:{index}"
+
+
+class TurnBuffer:
+    """
+    Recently streamed turns, kept for a short window so a client whose
+    connection dropped can resume with Last-Event-ID instead of asking again.
+
+    Memory is bounded by the total length of buffered content: the oldest
+    turns are dropped first once `max_chars` is exceeded.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_chars: Optional[int] = None, enabled: Optional[bool] = None):
+        """
+        Initialize the TurnBuffer.
+
+        Args:
+            ttl: Seconds a finished turn stays resumable
+                (defaults to TUTOR_STREAM_RESUME_SECONDS or 60)
+            max_chars: Total characters of content kept across turns
+                (defaults to TUTOR_STREAM_RESUME_MAX_CHARS or 8M)
+            enabled: Whether turns are kept for resuming
+                (defaults to TUTOR_STREAM_RESUME or true)
+        """
+        self.enabled = enabled if enabled is not None else os.getenv("TUTOR_STREAM_RESUME", "true").lower() == "true"
+        self.ttl = ttl if ttl is not None else float(os.getenv("TUTOR_STREAM_RESUME_SECONDS", "60"))
+        self.max_chars = max_chars if max_chars is not None else int(os.getenv("TUTOR_STREAM_RESUME_MAX_CHARS", "8000000"))
+        self._turns: "OrderedDict[str, BufferedTurn]" = OrderedDict()
+        self.resumed = 0
+        self.expired = 0
+        self.dropped = 0
+
+    @staticmethod
+    def new_turn_id() -> str:
+        return secrets.token_hex(8)
+
+    @staticmethod
+    def parse_event_id(event_id: str) -> Optional[Tuple[str, int]]:
+        """Split a Last-Event-ID value into (turn_id, chunk index)."""
+        turn_id, _, index = event_id.strip().rpartition(":")
+        if not turn_id or not index.isdigit():
+            return None
+        return turn_id, int(index)
+
+    def add(self, turn: BufferedTurn):
+        """Keep a turn for resuming, dropping expired and oldest turns as needed."""
+        if not self.enabled:
+            return
+        self._turns[turn.turn_id] = turn
+        self._prune()
+
+    def get(self, turn_id: str, session_id: str) -> Optional[BufferedTurn]:
+        """Return the buffered turn, if it is still held and belongs to `session_id`."""
+        self._prune()
+        turn = self._turns.get(turn_id)
+        if turn is None or turn.session_id != session_id:
+            self.expired += 1
+            return None
+        self.resumed += 1
+        return turn
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.ttl
+        for turn_id, turn in list(self._turns.items()):
+            if turn.flight.finished_at is not None and turn.flight.finished_at < cutoff:
+                del self._turns[turn_id]
+
+        total = sum(turn.flight.size for turn in self._turns.values())
+        while total > self.max_chars and self._turns:
+            _, turn = self._turns.popitem(last=False)
+            total -= turn.flight.size
+            self.dropped += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return how many turns are held and how often clients resumed."""
+        return {
+            "enabled": self.enabled,
+            "turns": len(self._turns),
+            "chars": sum(turn.flight.size for turn in self._turns.values()),
+            "max_chars": self.max_chars,
+            "ttl_seconds": self.ttl,
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "dropped": self.dropped,
+        }
@@ -1,41 +1,96 @@
 import os
+import time
 import asyncio
-from typing import List, Dict, Any, AsyncGenerator, Optional
+import hashlib
+import threading
+from collections import Counter
+from typing import List, Dict, Any, AsyncGenerator, Optional, Tuple
 
-from semantic_kernel import Kernel
-from semantic_kernel.agents import AgentGroupChat, ChatCompletionAgent
-from semantic_kernel.agents.strategies import (
-    KernelFunctionSelectionStrategy,
-    KernelFunctionTerminationStrategy,
-)
-from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.agents import AgentGroupChat
+from semantic_kernel.agents.group_chat.broadcast_queue import BroadcastQueue
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings
 from semantic_kernel.connectors.ai.function_choice_behavior import (
     FunctionChoiceBehavior,
 )
-from semantic_kernel.contents import ChatHistoryTruncationReducer
+from semantic_kernel.contents import AuthorRole, ChatMessageContent
+from semantic_kernel.filters import FilterTypes
 from semantic_kernel.functions import KernelFunctionFromPrompt
 
+from admission import check_admission, find_busy, get_admission_stats
+from hedging import get_hedging_stats
+from history_reducer import (
+    RollingSummary,
+    TokenBudgetReducer,
+    active_reducer,
+    get_history_stats as get_reducer_stats,
+)
+from math_verifier import annotate_message, get_math_check_stats
+from metrics import TurnMetrics
+from misconception_store import MisconceptionStore
+from model_router import ModelRouter, RoutedChatCompletionAgent, active_tier
+from prompt_usage import get_usage_stats, record_function_usage
+from quiz_evaluator import QuizEvaluator
+from response_cache import ResponseCache, compact_chunks
+from service_factory import create_kernel, get_pool_stats, warm_up_connections
+from session_pool import SessionPool
+from single_flight import Flight, SingleFlight
+from speculation import (
+    SPECULATIVE_REASONING,
+    Speculation,
+    SpeculativeReasoningAgent,
+    active_speculation,
+    get_speculation_stats,
+    should_speculate,
+)
+from turn_buffer import BufferedTurn, TurnBuffer
+from tutor_strategies import (
+    HeuristicTerminationStrategy,
+    RouterSelectionStrategy,
+    RouterTerminationStrategy,
+    RuleBasedSelectionStrategy,
+    TurnRouter,
+    get_strategy_stats,
+)
+
 # Define agent names
 TUTOR_NAME = "Tutor"
 REASONING_NAME = "Reasoning"
 
+class HistoryVersionMismatch(Exception):
+    """Raised when a client's view of the conversation differs from the server's."""
+    
+    def __init__(self, client_version: int, server_version: int):
+        super().__init__(
+            f"Conversation history is out of sync (client version {client_version}, server version {server_version})"
+        )
+        self.client_version = client_version
+        self.server_version = server_version
+
 class TutorAgentManager:
     """
     A class that manages the AI Tutor agents and provides methods
     for streaming conversation with them.
     """
     
-    def __init__(self, use_env_vars: bool = True):
+    def __init__(self, use_env_vars: bool = True, misconception_store: Optional[MisconceptionStore] = None):
         """
         Initialize the TutorAgentManager.
         
         Args:
             use_env_vars: Whether to load configuration from environment variables
+            misconception_store: Store of earlier Reasoning diagnoses to reuse
         """
         self.kernel = None
         self.chat = None
         self.tutor_agent = None
         self.reasoning_agent = None
+        self.misconception_store = misconception_store
+        self.model_router = None
+        self.math_check = os.getenv("TUTOR_MATH_CHECK", "true").lower() == "true"
+        # Start the Reasoning analysis of an answer while the Tutor is still replying
+        self.speculative_reasoning = SPECULATIVE_REASONING
+        # Number of user turns in the chat, compared with the client's count in delta requests
+        self.history_version = 0
         
         if use_env_vars:
             self._setup_from_env()
@@ -45,6 +100,9 @@ class TutorAgentManager:
         # Create kernel and add models
         self.kernel, _, _, _, _ = self._setup_kernel_with_models()
         
+        # Each turn is classified and its agents sent to the matching model tier
+        self.model_router = ModelRouter(self.kernel.services)
+        
         # Create agents
         self.tutor_agent = self._create_tutor_agent()
         self.reasoning_agent = self._create_reasoning_agent()
@@ -52,42 +110,44 @@ class TutorAgentManager:
         # Create the agent group chat
         self._setup_agent_chat()
     
+    def create_session(self) -> "TutorAgentManager":
+        """
+        Create a manager with its own agent chat for a separate conversation.
+        
+        The kernel and agents are shared with this manager; the chat history and
+        the selection/termination strategies are created fresh for the session.
+        """
+        session = TutorAgentManager(use_env_vars=False, misconception_store=self.misconception_store)
+        session.kernel = self.kernel
+        session.tutor_agent = self.tutor_agent
+        session.reasoning_agent = self.reasoning_agent
+        session.model_router = self.model_router
+        session._setup_agent_chat()
+        return session
+    
     def _setup_kernel_with_models(self):
         """Create and configure a kernel with both primary and secondary models."""
-        kernel = Kernel()
-
-        # Register the primary GPT-4o model for conversation
+        # The services, their API clients and connection pools are shared process-wide;
+        # a model with several deployments (AZURE_OPENAI_ENDPOINT_4o_2, ...) hedges slow
+        # calls and takes failing deployments out of rotation
+        kernel = create_kernel()
         primary_model_id = os.getenv("AZURE_OPENAI_DEPLOYMENT_4o")
         primary_service_id = "gpt4o"
-
-        kernel.add_service(
-            AzureChatCompletion(
-                service_id=primary_service_id,
-                deployment_name=primary_model_id,
-                api_key=os.getenv("AZURE_OPENAI_API_KEY_4o"),
-                endpoint=os.getenv("AZURE_OPENAI_ENDPOINT_4o")
-            )
-        )
-
-        # Register the secondary o1 model for deep reasoning
         secondary_model_id = os.getenv("AZURE_OPENAI_DEPLOYMENT_o1")
         secondary_service_id = "o1-model"
-
-        kernel.add_service(
-            AzureChatCompletion(
-                service_id=secondary_service_id,
-                deployment_name=secondary_model_id,
-                api_key=os.getenv("AZURE_OPENAI_API_KEY_o1"),
-                endpoint=os.getenv("AZURE_OPENAI_ENDPOINT_o1")
-            )
-        )
         
+        # Record prompt and cached tokens of prompt functions (strategies, summaries)
+        kernel.add_filter(FilterTypes.FUNCTION_INVOCATION, record_function_usage)
+
         self.kernel = kernel
         return kernel, primary_service_id, primary_model_id, secondary_service_id, secondary_model_id
     
     def _create_tutor_agent(self):
         """Create a tutor agent that can interact with students."""
-        return ChatCompletionAgent(
+        return RoutedChatCompletionAgent(
+            service_id="gpt4o",
+            tier_role="tutor",
+            router=self.model_router,
             kernel=self.kernel,
             name=TUTOR_NAME,
             instructions="""
@@ -103,13 +163,22 @@ Guidelines:
 - Suggest topics for the student to review based on their misunderstandings
 - Always maintain a helpful, tutoring tone
 - If a student's answer seems incorrect or confused, engage with the Reasoning agent to get a deeper analysis
+- To hand off to the Reasoning agent, address it as @Reasoning followed by what you need analyzed
+- If a student's message ends with a [Math check: ...] note, trust its result instead of recomputing;
+  answers marked correct need no Reasoning analysis
 """,
             function_choice_behavior=FunctionChoiceBehavior.NoneInvoke(),
         )
     
     def _create_reasoning_agent(self):
         """Create a reasoning agent that can analyze problems in depth."""
-        return ChatCompletionAgent(
+        # Known (question, wrong answer) pairs are answered from the misconception store,
+        # and an analysis started speculatively for the turn is used once it is asked for
+        return SpeculativeReasoningAgent(
+            misconception_store=self.misconception_store,
+            service_id="o1-model",
+            tier_role="reasoning",
+            router=self.model_router,
             kernel=self.kernel,
             name=REASONING_NAME,
             instructions="""
@@ -134,6 +203,41 @@ precise, and focused on what fundamental concepts the student may have misunders
     
     def _setup_agent_chat(self):
         """Set up the agent chat with selection and termination strategies."""
+        # The agents see system messages and recent turns within a token budget; older
+        # turns are folded into a summary that is updated in the background between turns
+        self.history_summary = RollingSummary(
+            self.kernel if os.getenv("TUTOR_HISTORY_SUMMARY", "true").lower() == "true" else None
+        )
+        # Cutting the window back to half the budget when it overflows keeps it append-only
+        # (and the prompt prefix cacheable) for several turns at a time
+        self.history_reducer = TokenBudgetReducer(
+            token_budget=int(os.getenv("TUTOR_HISTORY_TOKEN_BUDGET", "3000")),
+            refill_ratio=0.5,
+            summary=self.history_summary,
+        )
+        
+        # "router" makes one combined routing call per iteration; "split" keeps two prompts
+        if os.getenv("TUTOR_ORCHESTRATION", "router").lower() == "split":
+            selection_strategy, termination_strategy = self._create_split_strategies()
+        else:
+            selection_strategy, termination_strategy = self._create_router_strategies()
+
+        # Create the agent group chat with simpler configuration
+        self.chat = AgentGroupChat(
+            agents=[self.tutor_agent, self.reasoning_agent],
+            selection_strategy=selection_strategy,
+            termination_strategy=termination_strategy,
+        )
+    
+    def _create_strategy_reducer(self) -> TokenBudgetReducer:
+        """The last few messages, clipped to a token budget, for selection/termination prompts."""
+        return TokenBudgetReducer(
+            token_budget=int(os.getenv("TUTOR_STRATEGY_TOKEN_BUDGET", "1500")),
+            target_count=5,
+        )
+    
+    def _create_split_strategies(self):
+        """Create separate selection and termination strategies, each with its own prompt."""
         # Define selection function - simplified
         selection_function = KernelFunctionFromPrompt(
             function_name="selection",
@@ -176,41 +280,215 @@ HISTORY:
 """,
         )
 
-        history_reducer = ChatHistoryTruncationReducer(target_count=5)
+        history_reducer = self._create_strategy_reducer()
 
-        # Create the agent group chat with simpler configuration
-        self.chat = AgentGroupChat(
-            agents=[self.tutor_agent, self.reasoning_agent],
-            selection_strategy=KernelFunctionSelectionStrategy(
-                initial_agent=self.tutor_agent,
-                function=selection_function,
-                kernel=self.kernel,
-                result_parser=lambda result: str(result.value[0]).strip() if result.value and result.value[0] else TUTOR_NAME,
-                history_variable_name="lastmessage",
-                history_reducer=history_reducer,
-            ),
-            termination_strategy=KernelFunctionTerminationStrategy(
-                agents=[self.tutor_agent],
-                function=termination_function,
-                kernel=self.kernel,
-                result_parser=lambda result: "yes" in str(result.value[0]).lower() if result.value and result.value[0] else True,
-                history_variable_name="lastmessage",
-                maximum_iterations=3,
-                history_reducer=history_reducer,
+        # Deterministic turns are decided locally; only the Tutor handoff goes to the model
+        selection_strategy = RuleBasedSelectionStrategy(
+            initial_agent=self.tutor_agent,
+            tutor_name=TUTOR_NAME,
+            reasoning_name=REASONING_NAME,
+            function=selection_function,
+            kernel=self.kernel,
+            result_parser=lambda result: str(result.value[0]).strip() if result.value and result.value[0] else TUTOR_NAME,
+            history_variable_name="lastmessage",
+            history_reducer=history_reducer,
+        )
+
+        # Clear-cut endings and handoffs are decided locally before asking the model
+        termination_strategy = HeuristicTerminationStrategy(
+            agents=[self.tutor_agent],
+            reasoning_name=REASONING_NAME,
+            local_check=os.getenv("TUTOR_LOCAL_TERMINATION", "true").lower() == "true",
+            function=termination_function,
+            kernel=self.kernel,
+            result_parser=lambda result: "yes" in str(result.value[0]).lower() if result.value and result.value[0] else True,
+            history_variable_name="lastmessage",
+            maximum_iterations=3,
+            history_reducer=history_reducer,
+        )
+
+        return selection_strategy, termination_strategy
+    
+    def _create_router_strategies(self):
+        """Create selection and termination strategies that share one routing call per iteration."""
+        # Define routing function - selection and termination in one structured answer
+        routing_function = KernelFunctionFromPrompt(
+            function_name="routing",
+            prompt=f"""
+Decide how this agent conversation continues.
+Respond with a JSON object only, in the form {{"next_agent": "<agent name>", "done": <true or false>}}.
+
+Agents:
+- {TUTOR_NAME}
+- {REASONING_NAME}
+
+Set "done" to true if:
+1. The {TUTOR_NAME} has provided a complete response to the user's question
+2. The {TUTOR_NAME} has responded after getting input from the {REASONING_NAME}
+3. The conversation between agents has reached a natural conclusion
+
+Set "done" to false only if:
+- The {TUTOR_NAME} has explicitly asked the {REASONING_NAME} for help and the {REASONING_NAME} hasn't yet responded
+
+Set "next_agent" to the agent who should speak if the conversation continues:
+- If the message is from a user, the {TUTOR_NAME} should respond
+- If the message is from the {TUTOR_NAME} and explicitly asks for reasoning help, the {REASONING_NAME} should respond
+- If the message is from the {REASONING_NAME}, the {TUTOR_NAME} should respond
+
+HISTORY:
+{{{{$lastmessage}}}}
+""",
+            prompt_execution_settings=OpenAIChatPromptExecutionSettings(
+                response_format={"type": "json_object"},
             ),
         )
+
+        router = TurnRouter(
+            function=routing_function,
+            kernel=self.kernel,
+            default_agent_name=TUTOR_NAME,
+            history_variable_name="lastmessage",
+            history_reducer=self._create_strategy_reducer(),
+        )
+
+        # Local rules go first; the router is consulted only when they are uncertain
+        selection_strategy = RouterSelectionStrategy(
+            initial_agent=self.tutor_agent,
+            tutor_name=TUTOR_NAME,
+            reasoning_name=REASONING_NAME,
+            router=router,
+            function=routing_function,
+            kernel=self.kernel,
+        )
+
+        termination_strategy = RouterTerminationStrategy(
+            agents=[self.tutor_agent],
+            reasoning_name=REASONING_NAME,
+            local_check=os.getenv("TUTOR_LOCAL_TERMINATION", "true").lower() == "true",
+            router=router,
+            function=routing_function,
+            kernel=self.kernel,
+            maximum_iterations=3,
+        )
+
+        return selection_strategy, termination_strategy
+    
+    @property
+    def agent_names(self) -> List[str]:
+        """Names of the agents taking part in the chat."""
+        return [self.tutor_agent.name, self.reasoning_agent.name]
+    
+    @property
+    def prompt_version(self) -> str:
+        """Short hash identifying the agent instructions and orchestration that produce responses."""
+        source = "\n".join([
+            self.tutor_agent.instructions or "",
+            self.reasoning_agent.instructions or "",
+            os.getenv("TUTOR_ORCHESTRATION", "router").lower(),
+            self.model_router.signature if self.model_router else "",
+        ])
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+    
+    @property
+    def has_history(self) -> bool:
+        """Whether the chat already contains messages."""
+        return bool(self.chat and self.chat.history.messages)
+    
+    @property
+    def history_length(self) -> int:
+        """Number of messages in the chat history."""
+        return len(self.chat.history.messages) if self.chat else 0
+    
+    def rollback(self, history_length: int):
+        """
+        Drop every message after the first `history_length`, e.g. a cancelled turn's.
+        
+        The agents' channels are discarded too; they are rebuilt from the
+        remaining history the next time each agent speaks.
+        """
+        if not self.chat:
+            return
+        del self.chat.history.messages[history_length:]
+        self.chat.agent_channels.clear()
+        self.chat.channel_map.clear()
+        self.chat.broadcast_queue = BroadcastQueue()
+        self.chat.is_complete = False
+        self.history_version = sum(1 for message in self.chat.history.messages if message.role == AuthorRole.USER)
+    
+    async def load_history(self, messages: List[Dict[str, str]]):
+        """
+        Replace the chat history with the client's copy of the conversation.
+        
+        Args:
+            messages: Dicts with 'role' ('user' or 'assistant') and 'content';
+                assistant messages are attributed to the Tutor
+        """
+        if not self.chat:
+            return
+        
+        await self.chat.reset()
+        self.history_summary.reset()
+        history = []
+        for message in messages:
+            if message["role"] == "user":
+                history.append(ChatMessageContent(role=AuthorRole.USER, content=message["content"]))
+            elif message["role"] == "assistant":
+                history.append(ChatMessageContent(role=AuthorRole.ASSISTANT, name=TUTOR_NAME, content=message["content"]))
+        if history:
+            await self.chat.add_chat_messages(history)
+        self.chat.is_complete = False
+        self.history_version = sum(1 for message in history if message.role == AuthorRole.USER)
+    
+    async def record_turn(self, message: str, chunks: List[Dict[str, str]]):
+        """
+        Add a turn that was produced elsewhere (e.g. served from cache) to the chat history.
+        
+        Args:
+            message: The user's message
+            chunks: The streamed chunks of the agents' responses
+        """
+        if not self.chat:
+            return
+        
+        messages = [ChatMessageContent(role=AuthorRole.USER, content=message)]
+        for chunk in compact_chunks(chunks):
+            if chunk["content"]:
+                messages.append(ChatMessageContent(role=AuthorRole.ASSISTANT, name=chunk["agent"], content=chunk["content"]))
+        await self.chat.add_chat_messages(messages)
+        self.history_version += 1
+        self._schedule_summary()
+    
+    def _schedule_summary(self):
+        """Start folding turns that no longer fit the token budget into the summary."""
+        messages = self.chat.history.messages
+        self.history_summary.schedule(messages, self.history_reducer.window_start(messages))
+    
+    async def warm_up(self, timeout: float = 10.0):
+        """
+        Open a connection to each model endpoint so the first chat skips the TCP/TLS handshake.
+        
+        Failures are ignored: warm-up only saves latency, it does not validate configuration.
+        """
+        await warm_up_connections(timeout)
     
     async def reset(self):
         """Reset the chat history."""
         if self.chat:
             await self.chat.reset()
+            self.history_summary.reset()
+            self.history_version = 0
     
     async def add_message(self, message: str):
         """Add a message to the chat."""
         if self.chat:
+            # Check numeric/algebraic answers locally and give the Tutor the result
+            if self.math_check:
+                message = annotate_message(message)
+            
             # Ensure chat is ready for a new message
             self.chat.is_complete = False
             await self.chat.add_chat_message(message=message)
+            self.history_version += 1
     
     async def stream_response(self) -> AsyncGenerator[Dict[str, str], None]:
         """
@@ -224,11 +502,32 @@ HISTORY:
             return
 
         last_agent = None
+        reducer_token = active_reducer.set(self.history_reducer)
+        
+        # Send this turn's agents to the model tier its message calls for
+        last_user = next(
+            (message.content or "" for message in reversed(self.chat.history.messages) if message.role == AuthorRole.USER),
+            "",
+        )
+        tier = self.model_router.route(last_user) if self.model_router else None
+        tier_token = active_tier.set(tier)
+        
+        # An answer to grade usually ends with the Tutor asking Reasoning for an analysis:
+        # start it now, alongside the Tutor's reply, and drop it if the Tutor never asks
+        speculation = None
+        if self.speculative_reasoning and should_speculate(
+            last_user, tier.name if tier else ModelRouter.classify(last_user)
+        ):
+            speculation = Speculation(self.reasoning_agent, self.chat.history)
+        speculation_token = active_speculation.set(speculation)
+        start = time.perf_counter()
+        turn_metrics = TurnMetrics(self.chat.history.messages)
         
         try:
             async for response in self.chat.invoke_stream():
                 if response is None or not response.name:
                     continue
+                turn_metrics.chunk(response.name, response.content)
                 
                 # If this is a new agent speaking, indicate that
                 if last_agent != response.name:
@@ -241,35 +540,424 @@ HISTORY:
                     yield {"agent": response.name, "content": response.content}
                     
         except Exception as e:
-            if "Chat is already complete" in str(e):
+            busy = find_busy(e)
+            if busy is not None:
+                # A model deployment's queue is full: tell the client to retry instead of waiting
+                turn_metrics.error("busy")
+                yield {"error": str(busy), "busy": True, "retry_after": round(busy.retry_after)}
+            elif "Chat is already complete" in str(e):
                 # Expected when conversation turn ends normally
                 pass
             else:
+                turn_metrics.error(type(e).__name__)
                 yield {"error": str(e)}
+        finally:
+            turn_metrics.finish()
+            active_reducer.reset(reducer_token)
+            active_tier.reset(tier_token)
+            active_speculation.reset(speculation_token)
+            if speculation is not None:
+                speculation.finish()
+        
+        if tier is not None:
+            self.model_router.record(tier, (time.perf_counter() - start) * 1000)
         
         # Reset the completion state for the next conversation turn
         self.chat.is_complete = False
+        self._schedule_summary()
+
+# Reasoning diagnoses reused across students and sessions; the SQLite file is
+# opened on first use rather than at import
+_misconception_store: Optional[MisconceptionStore] = None
+_store_lock = threading.Lock()
+
+# The shared manager (kernel, model clients, agents) is built on first use or by
+# initialize(), so importing this module does not construct any clients
+_tutor_manager: Optional[TutorAgentManager] = None
+_quiz_evaluator: Optional[QuizEvaluator] = None
+_init_lock = threading.Lock()
+# The build running off the event loop, shared by every request that arrives during it
+_init_future: Optional[asyncio.Future] = None
+
+# Startup progress reported by the readiness endpoint
+startup_state: Dict[str, Any] = {
+    "agents_ready": False,
+    "warmed_up": False,
+    "init_ms": None,
+    "warm_up_ms": None,
+    "error": None,
+}
+
+def get_misconception_store() -> MisconceptionStore:
+    """Return the shared MisconceptionStore, opening it on first use."""
+    global _misconception_store
+    if _misconception_store is None:
+        with _store_lock:
+            if _misconception_store is None:
+                _misconception_store = MisconceptionStore()
+    return _misconception_store
+
+def get_tutor_manager() -> TutorAgentManager:
+    """Return the shared TutorAgentManager, building it on first use."""
+    global _tutor_manager
+    if _tutor_manager is None:
+        with _init_lock:
+            if _tutor_manager is None:
+                start = time.perf_counter()
+                _tutor_manager = TutorAgentManager(misconception_store=get_misconception_store())
+                startup_state["init_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                startup_state["agents_ready"] = True
+    return _tutor_manager
+
+def get_quiz_evaluator() -> QuizEvaluator:
+    """Return the shared QuizEvaluator, which uses the shared manager's kernel."""
+    global _quiz_evaluator
+    if _quiz_evaluator is None:
+        _quiz_evaluator = QuizEvaluator(get_tutor_manager().kernel)
+    return _quiz_evaluator
+
+async def wait_for_agents() -> TutorAgentManager:
+    """
+    Return the shared TutorAgentManager, building it in a worker thread if needed.
+    
+    Async code calls this before touching the manager, so a request arriving
+    while the agents are still being built waits for them without blocking
+    the event loop on the construction lock.
+    """
+    global _init_future
+    if _tutor_manager is not None:
+        return _tutor_manager
+    if _init_future is None or (_init_future.done() and _init_future.exception() is not None):
+        # No build yet, or the last one failed: start one
+        _init_future = asyncio.ensure_future(asyncio.to_thread(get_tutor_manager))
+    return await asyncio.shield(_init_future)
+
+async def initialize(warm_up: bool = False):
+    """
+    Build the shared agents off the event loop and optionally pre-open model connections.
+    
+    Args:
+        warm_up: Whether to open a connection to each model endpoint ahead of the first chat
+    """
+    try:
+        manager = await wait_for_agents()
+    except Exception as e:
+        # Leave construction to the first request, which will surface the error to the client
+        startup_state["error"] = str(e)
+        return
+    
+    if warm_up:
+        start = time.perf_counter()
+        await manager.warm_up()
+        startup_state["warm_up_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        startup_state["warmed_up"] = True
+
+def get_startup_state() -> Dict[str, Any]:
+    """Return whether the agents are built and warmed up, with timings."""
+    return dict(startup_state)
+
+# Session id used when a client does not send one
+DEFAULT_SESSION_ID = "default"
+
+# Per-session chats sharing the singleton's kernel and agents
+session_pool = SessionPool(lambda: get_tutor_manager().create_session())
+
+# Completed opening turns, replayed for repeated questions
+response_cache = ResponseCache()
+
+# Recent turns, kept so a client whose connection dropped can resume the stream
+turn_buffer = TurnBuffer()
 
-# Create a singleton instance for use across the application
-tutor_manager = TutorAgentManager()
+# How long an abandoned turn keeps running in case its client reconnects
+ABANDON_GRACE_SECONDS = float(os.getenv("TUTOR_STREAM_RESUME_GRACE_SECONDS", "5")) if turn_buffer.enabled else 0.0
+
+# Identical opening questions in flight at the same time share one generation
+SINGLE_FLIGHT_ENABLED = os.getenv("TUTOR_SINGLE_FLIGHT", "true").lower() == "true"
+single_flight = SingleFlight(ABANDON_GRACE_SECONDS)
+
+# Turn outcomes, including turns abandoned by a disconnected client
+turn_stats: Counter = Counter()
+
+async def _run_turn(session, message: str, cache_key: Optional[str] = None) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Run one turn in a session's agent chat, caching the result under `cache_key` if given.
+    
+    Args:
+        session: The pooled ChatSession to run the turn in
+        message: The user's message
+        cache_key: Response cache key for opening turns, or None
+        
+    Yields:
+        Dictionary with agent and content information for each chunk
+    """
+    # Turns within one session run one at a time; other sessions are not blocked
+    async with session.lock:
+        history_length = session.manager.history_length
+        turn_stats["started"] += 1
+        try:
+            # Add the message to the chat
+            await session.manager.add_message(message)
+            
+            # Stream the responses
+            chunks = []
+            busy = False
+            async for chunk in session.manager.stream_response():
+                if cache_key:
+                    chunks.append(chunk)
+                busy = busy or chunk.get("busy", False)
+                yield chunk
+            
+            if busy:
+                # The turn was turned away: drop it so the client's retry starts clean
+                session.manager.rollback(history_length)
+                turn_stats["busy"] += 1
+                return
+            
+            if cache_key and chunks and not any("error" in chunk for chunk in chunks):
+                response_cache.set(cache_key, compact_chunks(chunks))
+            turn_stats["completed"] += 1
+        except asyncio.CancelledError:
+            # Nobody is listening any more: drop the partial turn so the next one starts clean
+            session.manager.rollback(history_length)
+            turn_stats["cancelled"] += 1
+            raise
+        finally:
+            session_pool.touch(session)
 
-async def process_chat_message(message: str) -> AsyncGenerator[Dict[str, Any], None]:
+async def process_chat_message(
+    message: str,
+    session_id: Optional[str] = None,
+    disconnected: Optional[asyncio.Future] = None,
+    resumable: bool = True,
+    history_version: Optional[int] = None,
+) -> AsyncGenerator[Dict[str, Any], None]:
     """
     Process a chat message through the tutor system and stream the response.
     
+    The turn runs in a background task; if every client streaming it goes away
+    (`disconnected` resolves), the agents' work is cancelled and the partial
+    turn is removed from the chat.
+    
     Args:
         message: The user's message
+        session_id: The conversation the message belongs to
+        disconnected: Future resolved when the client goes away or cancels the turn
+        resumable: Whether the turn is buffered for resume_chat_message; turns that
+            are not are cancelled as soon as their client leaves
+        history_version: The number of turns the client believes the conversation
+            holds, for clients that send only the new message
         
     Yields:
         Dictionary with agent and content information for each chunk
+        
+    Raises:
+        HistoryVersionMismatch: If `history_version` differs from the server's
     """
-    # Add the message to the chat
-    await tutor_manager.add_message(message)
+    await wait_for_agents()
+    session = session_pool.get(session_id or DEFAULT_SESSION_ID)
+    
+    async with session.lock:
+        if history_version is not None and history_version != session.manager.history_version:
+            raise HistoryVersionMismatch(history_version, session.manager.history_version)
+        
+        # Opening turns have no session-specific context, so they can be shared
+        opening_turn = not session.manager.has_history
+        cache_key = None
+        if opening_turn:
+            cache_key = response_cache.make_key(message, session.manager.agent_names, session.manager.prompt_version)
+            cached_chunks = response_cache.get(cache_key) if response_cache.enabled else None
+            if cached_chunks is not None:
+                await session.manager.record_turn(message, cached_chunks)
+                for chunk in cached_chunks:
+                    yield chunk
+                return
+    
+    producer = lambda: _run_turn(session, message, cache_key if response_cache.enabled else None)
+    if opening_turn and SINGLE_FLIGHT_ENABLED:
+        # Identical opening questions already in flight share one upstream generation
+        flight, is_leader = single_flight.join(cache_key, producer, owner=session.session_id)
+    else:
+        flight, is_leader = Flight(session.session_id, ABANDON_GRACE_SECONDS, owner=session.session_id), True
+        flight.start(producer)
     
-    # Stream the responses
-    async for chunk in tutor_manager.stream_response():
+    turn = BufferedTurn(turn_buffer.new_turn_id(), session.session_id, message, flight, is_leader)
+    if not is_leader and flight.owner == session.session_id:
+        # A double submit joined its own session's flight: the leader's chat already gets the turn
+        turn.recorded = True
+    if resumable:
+        turn_buffer.add(turn)
+    
+    async for chunk in _follow_turn(turn, disconnected, resumable=resumable):
         yield chunk
 
-async def reset_chat():
-    """Reset the chat history."""
-    await tutor_manager.reset()
+async def _follow_turn(
+    turn: BufferedTurn, disconnected: Optional[asyncio.Future] = None, start: int = 0, resumable: bool = True
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """Stream a turn's chunks from index `start`, each tagged with its resumable event id."""
+    index = start
+    async for chunk in turn.flight.subscribe(disconnected, start, resumable):
+        yield {**chunk, "id": turn.event_id(index)}
+        index += 1
+    
+    # The leader's chat already holds the turn; followers copy it into their own history
+    flight = turn.flight
+    if (
+        not turn.recorded
+        and flight.done
+        and not (disconnected is not None and disconnected.done())
+        and not any("error" in chunk for chunk in flight.chunks)
+    ):
+        turn.recorded = True
+        session = session_pool.peek(turn.session_id)
+        if session is not None:
+            async with session.lock:
+                await session.manager.record_turn(turn.message, flight.chunks)
+
+def resume_chat_message(
+    last_event_id: str,
+    session_id: Optional[str] = None,
+    disconnected: Optional[asyncio.Future] = None,
+) -> Optional[Tuple[Optional[str], AsyncGenerator[Dict[str, Any], None]]]:
+    """
+    Continue streaming a turn after the last event the client received, without generating it again.
+    
+    Args:
+        last_event_id: The Last-Event-ID sent by the reconnecting client
+        session_id: The conversation the turn belongs to
+        disconnected: Future resolved when the client goes away
+        
+    Returns:
+        The agent that was speaking at that event and the remaining chunks,
+        or None if the turn is no longer buffered
+    """
+    parsed = TurnBuffer.parse_event_id(last_event_id)
+    if parsed is None:
+        return None
+    turn_id, index = parsed
+    turn = turn_buffer.get(turn_id, session_id or DEFAULT_SESSION_ID)
+    if turn is None:
+        return None
+    
+    chunks = turn.flight.chunks
+    last_agent = chunks[index].get("agent") if index < len(chunks) else None
+    return last_agent, _follow_turn(turn, disconnected, start=index + 1)
+
+async def sync_history(session_id: Optional[str], messages: List[Dict[str, str]]):
+    """Replace a session's chat history with the client's copy, e.g. after a HistoryVersionMismatch."""
+    await wait_for_agents()
+    session = session_pool.get(session_id or DEFAULT_SESSION_ID)
+    async with session.lock:
+        await session.manager.load_history(messages)
+
+def get_history_version(session_id: Optional[str] = None) -> int:
+    """Return the number of turns the server holds for a session."""
+    session = session_pool.peek(session_id or DEFAULT_SESSION_ID)
+    return session.manager.history_version if session else 0
+
+async def reset_chat(session_id: Optional[str] = None):
+    """Reset the chat history by dropping the session; the next message starts a fresh one."""
+    session_pool.discard(session_id or DEFAULT_SESSION_ID)
+
+def get_session_stats() -> Dict[str, Any]:
+    """Return occupancy and eviction statistics for the session pool."""
+    return session_pool.stats()
+
+async def evaluate_quiz_batch(
+    submissions: List[Dict[str, Any]], max_concurrency: Optional[int] = None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Grade a class's quiz submissions concurrently.
+    
+    Args:
+        submissions: Dicts with 'question', 'ground_truth', 'student_answer' and optional 'submission_id'
+        max_concurrency: Number of answers graded at once
+        
+    Yields:
+        One result dict per submission, in completion order
+    """
+    await wait_for_agents()
+    async for result in get_quiz_evaluator().evaluate_batch(submissions, max_concurrency):
+        yield result
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Return hit/miss statistics for the response cache."""
+    return response_cache.stats()
+
+def get_math_stats() -> Dict[str, Any]:
+    """Return outcomes of the local math answer check."""
+    return get_math_check_stats()
+
+def list_misconceptions(limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+    """Return stored misconception diagnoses, most recently used first."""
+    return get_misconception_store().list_entries(limit=limit, offset=offset)
+
+def purge_misconceptions(key: Optional[str] = None, older_than: Optional[float] = None) -> int:
+    """Delete stored misconception diagnoses; returns how many were removed."""
+    return get_misconception_store().purge(key=key, older_than=older_than)
+
+def get_misconception_stats() -> Dict[str, Any]:
+    """Return hit/miss statistics for the misconception store."""
+    return get_misconception_store().stats()
+
+def flush_misconception_hits():
+    """Write the misconception store's pending hit counts, e.g. at shutdown."""
+    if _misconception_store is not None:
+        _misconception_store.flush_hits()
+
+def get_history_stats() -> Dict[str, Any]:
+    """Return how much the token budget trimmed the agents' histories."""
+    return get_reducer_stats()
+
+def get_prompt_usage_stats() -> Dict[str, Any]:
+    """Return prompt, cached and completion tokens per agent and strategy function, and per turn."""
+    return get_usage_stats(turns=turn_stats["completed"])
+
+def get_routing_stats() -> Dict[str, Any]:
+    """Return the mix of model tiers turns were routed to, with latency against each tier's budget."""
+    if _tutor_manager is None or _tutor_manager.model_router is None:
+        return {"enabled": False, "routed_turns": 0, "tiers": {}}
+    return _tutor_manager.model_router.stats()
+
+def check_chat_admission(message: str):
+    """
+    Raise ServiceBusy if the model that answers `message` first is turning new calls away.
+    
+    Lets the API answer "busy" before opening a stream rather than partway through a turn.
+    """
+    manager = _tutor_manager
+    if manager is None:
+        # Nothing has been sent to the models yet
+        return
+    router = manager.model_router
+    service_id = manager.tutor_agent.service_id
+    if router is not None and router.enabled:
+        service_id = router.settings_for("tutor", service_id, router.tiers[router.classify(message)]).service_id
+    check_admission([service_id])
+
+def get_admission_control_stats() -> Dict[str, Any]:
+    """Return running, queued and rejected model calls per deployment."""
+    return get_admission_stats()
+
+def get_endpoint_stats() -> Dict[str, Any]:
+    """Return hedged calls, failovers and circuit state per deployment of multi-endpoint models."""
+    return get_hedging_stats()
+
+def get_connection_pool_stats() -> Dict[str, Any]:
+    """Return requests, HTTP versions and connection reuse per model endpoint."""
+    return get_pool_stats()
+
+def get_speculative_reasoning_stats() -> Dict[str, Any]:
+    """Return how many speculative Reasoning analyses were started, used and dropped."""
+    return get_speculation_stats()
+
+def get_turn_stats() -> Dict[str, Any]:
+    """Return how many turns were started, completed and cancelled."""
+    return dict(turn_stats)
+
+def get_resume_stats() -> Dict[str, Any]:
+    """Return how many turns are buffered for resuming and how often clients resumed."""
+    return turn_buffer.stats()
+
+def get_single_flight_stats() -> Dict[str, Any]:
+    """Return deduplication statistics for in-flight requests."""
+    return single_flight.stats()
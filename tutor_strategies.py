@@ -0,0 +1,272 @@
+import re
+import json
+import time
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, ValidationError
+from semantic_kernel.agents import Agent
+from semantic_kernel.agents.strategies import (
+    KernelFunctionSelectionStrategy,
+    KernelFunctionTerminationStrategy,
+)
+from semantic_kernel.contents import AuthorRole, ChatHistoryReducer, ChatMessageContent
+from semantic_kernel.functions import FunctionResult, KernelArguments, KernelFunction
+from semantic_kernel import Kernel
+
+from math_verifier import VERIFIED_CORRECT_MARKER
+from metrics import selection_latency, termination_latency
+
+logger = logging.getLogger(__name__)
+
+# Process-wide counters shared by every session's strategies
+strategy_stats: Counter = Counter()
+
+
+def has_handoff_marker(content: Optional[str], agent_name: str) -> bool:
+    """Whether the message explicitly hands off to `agent_name` with an @-mention."""
+    if not content:
+        return False
+    return re.search(rf"(?<!\w)@{re.escape(agent_name)}\b", content, re.IGNORECASE) is not None
+
+
+class RuleBasedSelectionStrategy(KernelFunctionSelectionStrategy):
+    """
+    Selection strategy that applies the deterministic turn-taking rules locally
+    and only calls the selection function when the choice is ambiguous.
+
+    - After a user message the Tutor speaks
+    - After the Reasoning agent the Tutor speaks again
+    - After the Tutor, the selection function decides whether it asked for reasoning help
+    """
+
+    tutor_name: str
+    reasoning_name: str
+
+    async def select_agent(self, agents: List[Agent], history: List[ChatMessageContent]) -> Agent:
+        """Select the next agent, using the local rules when they apply."""
+        start = time.perf_counter()
+        agent = self._select_locally(agents, history)
+        if agent is not None:
+            strategy_stats["selection_fast_path"] += 1
+            logger.debug(f"Selection fast path chose {agent.name}")
+            selection_latency.observe(time.perf_counter() - start, "local")
+            return agent
+
+        strategy_stats["selection_llm"] += 1
+        try:
+            return await self._select_with_function(agents, history)
+        finally:
+            selection_latency.observe(time.perf_counter() - start, "model")
+
+    def _select_locally(self, agents: List[Agent], history: List[ChatMessageContent]) -> Optional[Agent]:
+        """Return the next agent if the rules decide it, otherwise None."""
+        if not history:
+            return self._find_agent(agents, self.tutor_name)
+
+        last_message = history[-1]
+        if last_message.role == AuthorRole.USER or last_message.name == self.reasoning_name:
+            return self._find_agent(agents, self.tutor_name)
+
+        if has_handoff_marker(last_message.content, self.reasoning_name):
+            return self._find_agent(agents, self.reasoning_name)
+
+        # The Tutor spoke last without a marker: whether it asked for help needs the model
+        return None
+
+    async def _select_with_function(self, agents: List[Agent], history: List[ChatMessageContent]) -> Agent:
+        """Fall back to the kernel function selection."""
+        return await super().select_agent(agents, history)
+
+    @staticmethod
+    def _find_agent(agents: List[Agent], name: str) -> Optional[Agent]:
+        return next((agent for agent in agents if agent.name == name), None)
+
+
+class HeuristicTerminationStrategy(KernelFunctionTerminationStrategy):
+    """
+    Termination strategy that classifies the Tutor's message locally and only
+    calls the termination function when the local check is uncertain.
+
+    - The Tutor answered after the Reasoning agent: done
+    - The student's answer was verified correct by the local math check: done
+    - The Tutor handed off with an explicit @Reasoning marker: continue
+    - The Tutor never mentioned the Reasoning agent: done
+    - Anything else is escalated to the termination function
+    """
+
+    reasoning_name: str
+    local_check: bool = True
+
+    async def should_agent_terminate(self, agent: Agent, history: List[ChatMessageContent]) -> bool:
+        """Decide termination, using the local check first when enabled."""
+        start = time.perf_counter()
+        if self.local_check:
+            decision = self._classify_locally(history)
+            if decision is not None:
+                strategy_stats["termination_local_done" if decision else "termination_local_continue"] += 1
+                termination_latency.observe(time.perf_counter() - start, "local")
+                return decision
+
+        strategy_stats["termination_llm"] += 1
+        try:
+            return await self._terminate_with_function(agent, history)
+        finally:
+            elapsed = time.perf_counter() - start
+            strategy_stats["termination_llm_ms"] += int(elapsed * 1000)
+            termination_latency.observe(elapsed, "model")
+
+    def _classify_locally(self, history: List[ChatMessageContent]) -> Optional[bool]:
+        """Return True/False when the message shape decides termination, otherwise None."""
+        if not history:
+            return True
+
+        last_message = history[-1]
+
+        # Look back over the current turn for a Reasoning contribution or a verified answer
+        for message in reversed(history[:-1]):
+            if message.role == AuthorRole.USER:
+                if VERIFIED_CORRECT_MARKER in (message.content or ""):
+                    return True
+                break
+            if message.name == self.reasoning_name:
+                return True
+
+        content = last_message.content or ""
+        if has_handoff_marker(content, self.reasoning_name):
+            return False
+        if self.reasoning_name.lower() not in content.lower():
+            return True
+
+        # Mentions the Reasoning agent without a marker: could be a handoff or a reference
+        return None
+
+    async def _terminate_with_function(self, agent: Agent, history: List[ChatMessageContent]) -> bool:
+        """Fall back to the kernel function termination check."""
+        return await super().should_agent_terminate(agent, history)
+
+
+class RoutingDecision(BaseModel):
+    """The router's combined answer: who speaks next and whether the turn is done."""
+
+    next_agent: str
+    done: bool
+
+
+class TurnRouter:
+    """
+    Makes a single routing call per group-chat iteration.
+
+    The routing function returns the next agent and the done/continue decision
+    together as JSON. The decision is parsed once and cached against the
+    history it was made for, so the termination check and the following
+    selection share one model request.
+    """
+
+    def __init__(
+        self,
+        function: KernelFunction,
+        kernel: Kernel,
+        default_agent_name: str,
+        history_variable_name: str = "lastmessage",
+        history_reducer: Optional[ChatHistoryReducer] = None,
+    ):
+        """
+        Initialize the TurnRouter.
+
+        Args:
+            function: Prompt function that answers with a RoutingDecision as JSON
+            kernel: Kernel used to invoke the function
+            default_agent_name: Agent to pick when the answer cannot be parsed
+            history_variable_name: Prompt variable that receives the history
+            history_reducer: Optional reducer applied to the history before the call
+        """
+        self.function = function
+        self.kernel = kernel
+        self.default_agent_name = default_agent_name
+        self.history_variable_name = history_variable_name
+        self.history_reducer = history_reducer
+        self._decision: Optional[RoutingDecision] = None
+        self._decided_for: Optional[ChatMessageContent] = None
+        self._decided_length = 0
+
+    async def decide(self, history: List[ChatMessageContent]) -> RoutingDecision:
+        """Return the routing decision for `history`, calling the model at most once per history state."""
+        if (
+            self._decision is not None
+            and history
+            and history[-1] is self._decided_for
+            and len(history) == self._decided_length
+        ):
+            strategy_stats["router_shared"] += 1
+            return self._decision
+
+        if self.history_reducer is not None:
+            self.history_reducer.messages = history
+            reduced_history = await self.history_reducer.reduce()
+            messages = reduced_history.messages if reduced_history is not None else history
+        else:
+            messages = history
+
+        arguments = KernelArguments(
+            **{self.history_variable_name: [message.to_dict(role_key="role", content_key="content") for message in messages]}
+        )
+
+        strategy_stats["router_calls"] += 1
+        result = await self.function.invoke(kernel=self.kernel, arguments=arguments)
+
+        self._decision = self._parse(result)
+        self._decided_for = history[-1] if history else None
+        self._decided_length = len(history)
+        return self._decision
+
+    def _parse(self, result: Optional[FunctionResult]) -> RoutingDecision:
+        """Parse the routing JSON, falling back to the Tutor ending the turn."""
+        text = str(result.value[0]) if result and result.value else ""
+        match = re.search(r"\{.*\}", text, re.DOTALL)
+        try:
+            return RoutingDecision.model_validate(json.loads(match.group(0) if match else text))
+        except (ValueError, ValidationError):
+            logger.warning(f"Unparseable routing decision: {text!r}")
+            strategy_stats["router_parse_errors"] += 1
+            return RoutingDecision(next_agent=self.default_agent_name, done=True)
+
+
+class RouterSelectionStrategy(RuleBasedSelectionStrategy):
+    """Rule-based selection that defers ambiguous choices to a shared TurnRouter."""
+
+    router: TurnRouter
+
+    async def _select_with_function(self, agents: List[Agent], history: List[ChatMessageContent]) -> Agent:
+        decision = await self.router.decide(history)
+        return self._find_agent(agents, decision.next_agent) or self._find_agent(agents, self.tutor_name)
+
+
+class RouterTerminationStrategy(HeuristicTerminationStrategy):
+    """Heuristic termination that defers uncertain cases to a shared TurnRouter."""
+
+    router: TurnRouter
+
+    async def _terminate_with_function(self, agent: Agent, history: List[ChatMessageContent]) -> bool:
+        decision = await self.router.decide(history)
+        return decision.done
+
+
+def _ratio(part: int, whole: int) -> float:
+    return part / whole if whole else 0.0
+
+
+def get_strategy_stats() -> Dict[str, Any]:
+    """Return how often each strategy path was taken."""
+    selections = strategy_stats["selection_fast_path"] + strategy_stats["selection_llm"]
+    local_terminations = strategy_stats["termination_local_done"] + strategy_stats["termination_local_continue"]
+    llm_terminations = strategy_stats["termination_llm"]
+    average_llm_ms = strategy_stats["termination_llm_ms"] / llm_terminations if llm_terminations else 0.0
+    return {
+        **strategy_stats,
+        "selection_fast_path_ratio": _ratio(strategy_stats["selection_fast_path"], selections),
+        "termination_local_ratio": _ratio(local_terminations, local_terminations + llm_terminations),
+        # Each local decision skipped one termination call of roughly average duration
+        "termination_estimated_ms_saved": int(local_terminations * average_llm_ms),
+    }